@@ -8,8 +8,53 @@ load_dotenv()
 class Settings:
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     mongodb_uri: str = os.getenv("MONGODB_URI", "")
+    mongo_max_pool_size: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    mongo_min_pool_size: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+    mongo_connect_timeout_ms: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    mongo_socket_timeout_ms: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+    mongo_page_size: int = int(os.getenv("MONGO_PAGE_SIZE", "20"))
+    mongo_cache_size: int = int(os.getenv("MONGO_CACHE_SIZE", "256"))
+    mongo_bulk_batch_size: int = int(os.getenv("MONGO_BULK_BATCH_SIZE", "500"))
+    mongo_cache_ttl: float = float(os.getenv("MONGO_CACHE_TTL", "30"))
+    viewer_cache_size: int = int(os.getenv("VIEWER_CACHE_SIZE", "64"))
+    viewer_inline_chars: int = int(os.getenv("VIEWER_INLINE_CHARS", "20000"))
     chroma_persist_dir: str = os.getenv("CHROMA_PERSIST_DIR", ".chroma")
     embedding_model: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     chat_model: str = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+    openai_timeout: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+    openai_max_retries: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    openai_max_connections: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    resource_health_interval: float = float(os.getenv("RESOURCE_HEALTH_INTERVAL", "60"))
+    resource_backoff_base: float = float(os.getenv("RESOURCE_BACKOFF_BASE", "1"))
+    resource_backoff_max: float = float(os.getenv("RESOURCE_BACKOFF_MAX", "60"))
+    resource_close_grace: float = float(os.getenv("RESOURCE_CLOSE_GRACE", "300"))
+    chroma_write_batch_size: int = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "256"))
+    chroma_write_batch_chars: int = int(os.getenv("CHROMA_WRITE_BATCH_CHARS", "200000"))
+    snapshot_dir: str = os.getenv("SNAPSHOT_DIR", ".snapshots")
+    snapshot_page_size: int = int(os.getenv("SNAPSHOT_PAGE_SIZE", "1000"))
+    dedupe_mode: str = os.getenv("DEDUPE_MODE", "reference").lower()
+    dedupe_threshold: float = float(os.getenv("DEDUPE_THRESHOLD", "0.85"))
+    dedupe_num_perm: int = int(os.getenv("DEDUPE_NUM_PERM", "128"))
+    dedupe_bands: int = int(os.getenv("DEDUPE_BANDS", "16"))
+    reembed_batch_size: int = int(os.getenv("REEMBED_BATCH_SIZE", "100"))
+    reembed_pause_seconds: float = float(os.getenv("REEMBED_PAUSE_SECONDS", "0.5"))
+    collection_drop_grace: float = float(os.getenv("COLLECTION_DROP_GRACE", "300"))
+    digest_enabled: bool = os.getenv("DIGEST_ENABLED", "false").lower() in ("1", "true", "yes")
+    digest_max_workers: int = int(os.getenv("DIGEST_MAX_WORKERS", "4"))
+    digest_questions: int = int(os.getenv("DIGEST_QUESTIONS", "8"))
+    digest_token_budget: int = int(os.getenv("DIGEST_TOKEN_BUDGET", "6000"))
+    digest_match_threshold: float = float(os.getenv("DIGEST_MATCH_THRESHOLD", "0.92"))
+    digest_route_min_files: int = int(os.getenv("DIGEST_ROUTE_MIN_FILES", "8"))
+    digest_route_top_files: int = int(os.getenv("DIGEST_ROUTE_TOP_FILES", "4"))
+    pdf_backend: str = os.getenv("PDF_BACKEND", "pypdf2")
+    pdf_fallback_backends: str = os.getenv("PDF_FALLBACK_BACKENDS", "pypdf2")
+    analysis_cache_size: int = int(os.getenv("ANALYSIS_CACHE_SIZE", "64"))
+    map_reduce_threshold_chars: int = int(os.getenv("MAP_REDUCE_THRESHOLD_CHARS", "60000"))
+    map_reduce_chunk_chars: int = int(os.getenv("MAP_REDUCE_CHUNK_CHARS", "24000"))
+    extraction_max_workers: int = int(os.getenv("EXTRACTION_MAX_WORKERS", "4"))
+    batch_max_workers: int = int(os.getenv("BATCH_MAX_WORKERS", "3"))
+    prefilter_token_budget: int = int(os.getenv("PREFILTER_TOKEN_BUDGET", "40000"))
+    prefilter_use_embeddings: bool = os.getenv("PREFILTER_USE_EMBEDDINGS", "false").lower() in ("1", "true", "yes")
+    extract_info_token_budget: int = int(os.getenv("EXTRACT_INFO_TOKEN_BUDGET", "500"))
 
 settings = Settings()
@@ -1,21 +1,57 @@
 from __future__ import annotations
 
+import os
 import re
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
 import streamlit as st
 
-from app.services.chroma_store import query, add_texts
+from app.config.settings import settings
+
+from app.services import digest
+from app.services.chroma_store import (
+    add_texts_deduplicated,
+    build_where,
+    chunk_metadata,
+    collection_embedding,
+    collection_facets,
+    delete_collection,
+    delete_ids,
+    embed_query,
+    file_chunk_ids,
+    list_collection_names,
+    list_files,
+    query,
+)
 from app.services.openai_client import stream_chat
-from app.utils.pdf import extract_text_from_pdf, chunk_text
+from app.utils.pdf import chunk_pages, extract_pages_from_pdf, guess_document_type
 
 
 class AIChatbot:
-    def __init__(self, collection_name: str):
+    def __init__(self, collection_name: str, where: Optional[Dict] = None):
         self.collection_name = collection_name
-
-    def generate_response(self, user_input: str):
-        docs = query(self.collection_name, user_input, k=3)
+        self.where = where
+        self.digest_hit: Optional[Dict] = None
+
+    def generate_response(self, user_input: str) -> Iterator[str]:
+        """Stream the answer text, from the collection digest when a suggested question matches."""
+        embedding = embed_query(self.collection_name, user_input)
+        where = self.where
+        self.digest_hit = None
+        if where is None:
+            # The digest only covers the whole collection, so it is skipped when filters are set.
+            model, _ = collection_embedding(self.collection_name)
+            self.digest_hit = digest.match_question(self.collection_name, embedding, model)
+            if self.digest_hit is not None:
+                return iter([self.digest_hit["answer"]])
+            routed = digest.route_files(self.collection_name, embedding, model, list_files(self.collection_name))
+            if routed:
+                # query() maps deduplicated chunks of these files to the chunks they point to.
+                where = build_where(files=routed)
+        docs = query(self.collection_name, user_input, k=3, where=where, embedding=embedding)
         context = " ".join(docs)
-        return stream_chat([
+        stream = stream_chat([
             {
                 "role": "system",
                 "content": (
@@ -26,6 +62,7 @@ class AIChatbot:
             },
             {"role": "user", "content": f"Context: {context}\n\nQuestion: {user_input}"},
         ])
+        return (chunk.choices[0].delta.content for chunk in stream if chunk.choices[0].delta.content is not None)
 
 
 def _fix_markdown_spacing(text: str) -> str:
@@ -62,22 +99,26 @@ def _fix_markdown_spacing(text: str) -> str:
     return text
 
 
+DIGEST_LABEL = "Summarise files and pre-answer likely questions"
+
+
 def manage_collections_ui():
     st.header("Manage Collections")
-    from app.services.chroma_store import get_client
-
-    client = get_client()
-    collections = [c.name for c in client.list_collections()]
+    collections = list_collection_names()
 
-    task = st.radio("What would you like to do?", ("Add Collection", "Modify Collection", "Delete Collection"))
+    task = st.radio(
+        "What would you like to do?",
+        ("Add Collection", "Modify Collection", "Delete Collection", "Snapshots", "Embedding Model"),
+    )
 
     if task == "Add Collection":
         st.subheader("Add New Collection")
         new_collection_name = st.text_input("Collection Name")
         uploaded_files = st.file_uploader("Upload PDF Files", type="pdf", accept_multiple_files=True)
+        build_digest = st.checkbox(DIGEST_LABEL, value=settings.digest_enabled, key="digest_new")
         if st.button("Add Collection"):
             if new_collection_name and uploaded_files:
-                _add_files_to_collection(new_collection_name, uploaded_files)
+                _add_files_to_collection(new_collection_name, uploaded_files, build_digest)
 
     elif task == "Modify Collection":
         st.subheader("Modify Existing Collection")
@@ -85,8 +126,9 @@ def manage_collections_ui():
         if selected_collection:
             st.write("Add new files:")
             new_files = st.file_uploader(f"Add PDF Files to {selected_collection}", type="pdf", accept_multiple_files=True)
+            build_digest = st.checkbox(DIGEST_LABEL, value=settings.digest_enabled, key="digest_modify")
             if st.button("Add Files") and new_files:
-                _add_files_to_collection(selected_collection, new_files)
+                _add_files_to_collection(selected_collection, new_files, build_digest)
 
             st.write("Delete existing files:")
             existing_files = _list_files_in_collection(selected_collection)
@@ -103,57 +145,175 @@ def manage_collections_ui():
         st.subheader("Delete Collection")
         selected_collection = st.selectbox("Select a Collection to Delete", collections)
         if st.button("Delete Collection") and selected_collection:
-            from app.services.chroma_store import get_client
-
-            client.delete_collection(name=selected_collection)
+            delete_collection(selected_collection)
             st.success(f"Deleted collection '{selected_collection}'.")
 
-
-def _add_files_to_collection(collection_name: str, files):
+    elif task == "Snapshots":
+        _snapshots_ui(collections)
+
+    elif task == "Embedding Model":
+        _reembed_ui(collections)
+
+
+def _reembed_ui(collections):
+    from app.services.reembed import cancel_reembedding, job_status, start_reembedding
+
+    st.subheader("Embedding Model")
+    st.write(f"Configured model: {settings.embedding_model}")
+    if not collections:
+        st.info("No collections yet.")
+        return
+    rows = []
+    for name in collections:
+        model, dim = collection_embedding(name)
+        rows.append({"collection": name, "model": model, "dimension": dim})
+    st.table(rows)
+
+    stale = [r["collection"] for r in rows if r["model"] != settings.embedding_model]
+    selected = st.selectbox(
+        "Select a Collection to Re-embed", collections, index=collections.index(stale[0]) if stale else 0
+    )
+    job = job_status(selected)
+    if job is not None and job.running:
+        st.progress(min(job.done / job.total, 1.0) if job.total else 0.0, text=f"Re-embedded {job.done} of {job.total} chunks")
+        st.caption("Questions are answered from the current version until the new one is complete.")
+        col1, col2 = st.columns(2)
+        col1.button("Refresh")
+        if col2.button("Cancel"):
+            cancel_reembedding(selected)
+            st.rerun()
+        return
+    if job is not None and job.status == "failed":
+        st.error(f"Last re-embedding failed: {job.error}")
+    elif job is not None and job.status == "done":
+        st.success(f"'{selected}' now uses {job.model}.")
+    if st.button(f"Re-embed with {settings.embedding_model}"):
+        start_reembedding(selected)
+        st.rerun()
+
+
+def _snapshots_ui(collections):
+    from app.services.snapshots import SnapshotError, export_collection, import_snapshot, list_snapshots
+
+    st.subheader("Export Snapshot")
+    selected_collection = st.selectbox("Select a Collection to Export", collections)
+    if st.button("Export Snapshot") and selected_collection:
+        try:
+            with st.spinner("Exporting collection..."):
+                path = export_collection(selected_collection)
+            st.success(f"Exported '{selected_collection}' to {path}.")
+        except (SnapshotError, OSError) as e:
+            st.error(str(e))
+
+    st.subheader("Import Snapshot")
+    snapshots = list_snapshots()
+    if not snapshots:
+        st.info(f"No snapshots found in '{settings.snapshot_dir}'.")
+        return
+    snapshot = st.selectbox("Select a Snapshot", snapshots)
+    target = st.text_input("Collection Name", value=snapshot.rsplit("-", 1)[0])
+    overwrite = st.checkbox("Replace the collection if it already exists")
+    if st.button("Import Snapshot") and snapshot and target:
+        try:
+            with st.spinner("Restoring collection..."):
+                count = import_snapshot(os.path.join(settings.snapshot_dir, snapshot), target, overwrite=overwrite)
+            st.success(f"Restored {count} chunks into collection '{target}'.")
+        except (SnapshotError, OSError) as e:
+            st.error(str(e))
+
+
+def _add_files_to_collection(collection_name: str, files, build_digest: bool = False):
     ids = []
     chunks_all = []
+    metadatas = []
+    pages_by_file = {}
+    ingested = datetime.now(timezone.utc)
     for file in files:
-        text = extract_text_from_pdf(file)
-        chunks = chunk_text(text)
-        chunks_all.extend(chunks)
+        pages = extract_pages_from_pdf(file)
+        pages_by_file[file.name] = pages
+        doc_type = guess_document_type(file.name, pages[0] if pages else "")
+        chunks = chunk_pages(pages)
+        chunks_all.extend(c for c, _, _ in chunks)
         ids.extend([f"{file.name}_{i}" for i in range(len(chunks))])
-    add_texts(collection_name, chunks_all, ids)
+        metadatas.extend(chunk_metadata(file.name, start, end, doc_type, ingested) for _, start, end in chunks)
+    bar = st.progress(0.0, text="Embedding chunks...")
+
+    def progress(done: int, total: int) -> None:
+        bar.progress(done / total if total else 1.0, text=f"Stored {done} of {total} chunks")
+
+    try:
+        skipped = add_texts_deduplicated(collection_name, chunks_all, ids, metadatas, progress=progress)
+    except Exception as e:
+        st.error(f"Upload stopped: {e}. Add the same files again to resume where it stopped.")
+        return
+    bar.empty()
     st.success(f"Added {len(files)} PDF files to collection '{collection_name}'.")
+    if skipped:
+        st.info(f"Skipped embedding {skipped} near-duplicate chunks.")
+    if build_digest:
+        with st.spinner("Summarising files..."):
+            entries = digest.build_digests(pages_by_file)
+            digest.add_files(collection_name, entries, collection_embedding(collection_name)[0])
+        questions = sum(len(e["questions"]) for e in entries.values())
+        st.info(f"Summarised {len(entries)} of {len(files)} files with {questions} suggested questions.")
 
 
 def _list_files_in_collection(collection_name: str):
-    from app.services.chroma_store import get_or_create_collection
-
-    collection = get_or_create_collection(collection_name)
-    all_ids = collection.get()["ids"]
-    return list(set([i.split("_")[0] for i in all_ids]))
+    return list_files(collection_name)
 
 
 def _delete_files_from_collection(collection_name: str, file_names):
-    from app.services.chroma_store import get_or_create_collection
-
-    collection = get_or_create_collection(collection_name)
     for file_name in file_names:
-        chunk_ids = [i for i in collection.get()["ids"] if i.startswith(f"{file_name}_")]
+        chunk_ids = file_chunk_ids(collection_name, file_name)
         if chunk_ids:
-            collection.delete(ids=chunk_ids)
+            delete_ids(collection_name, chunk_ids)
+            digest.forget_files(collection_name, [file_name])
             st.success(f"Deleted file '{file_name}' from collection '{collection_name}'.")
         else:
             st.warning(f"No chunks found for file '{file_name}' in collection '{collection_name}'.")
 
 
+def _chat_filters_ui(collection_name: str) -> Optional[Dict]:
+    """Render the retrieval scope widgets and return the matching Chroma ``where`` clause."""
+    facets = collection_facets(collection_name)
+    with st.expander("Limit answers to files, pages or dates"):
+        files = st.multiselect("Files", facets["files"])
+        doc_types = st.multiselect("Document types", facets["doc_types"])
+        pages = None
+        if facets["max_page"] > 1 and st.checkbox("Only these pages"):
+            pages = st.slider("Pages", 1, facets["max_page"], (1, facets["max_page"]))
+        dates = None
+        if st.checkbox("Only files added between"):
+            dates = st.date_input("Ingest dates", value=())
+            dates = dates if isinstance(dates, tuple) and len(dates) == 2 else None
+        st.caption(
+            "Files uploaded before filters were introduced only match when no filter is set; add them again to make them filterable."
+        )
+    return build_where(files, doc_types, pages, dates)
+
+
 def chatbot_interface_ui():
     st.header("AI Chatbot Interface")
-    from app.services.chroma_store import get_client
-
-    client = get_client()
-    collections = [c.name for c in client.list_collections()]
+    collections = list_collection_names()
 
     selected_collection = st.selectbox("Select a Collection", collections)
 
     if selected_collection:
         st.write(f"Using collection: {selected_collection}")
-        chatbot = AIChatbot(selected_collection)
+        model, _ = collection_embedding(selected_collection)
+        if model != settings.embedding_model:
+            st.caption(
+                f"This collection was embedded with {model}; re-embed it with {settings.embedding_model} "
+                "under Manage Collections."
+            )
+        chatbot = AIChatbot(selected_collection, where=_chat_filters_ui(selected_collection))
+        summaries = digest.files(selected_collection)
+        if summaries:
+            with st.expander("About this collection"):
+                for name, entry in sorted(summaries.items()):
+                    st.markdown(f"**{name}**")
+                    st.write(entry["summary"])
+                    st.caption(" · ".join(q["question"] for q in entry["questions"]))
 
         if "messages" not in st.session_state:
             st.session_state["messages"] = []
@@ -172,10 +332,11 @@ def chatbot_interface_ui():
             with st.chat_message("assistant"):
                 message_placeholder = st.empty()
                 full_response = ""
-                for response in chatbot.generate_response(user_input):
-                    if response.choices[0].delta.content is not None:
-                        full_response += response.choices[0].delta.content
-                        message_placeholder.markdown(_fix_markdown_spacing(full_response) + "▌")
+                for text in chatbot.generate_response(user_input):
+                    full_response += text
+                    message_placeholder.markdown(_fix_markdown_spacing(full_response) + "▌")
                 cleaned = _fix_markdown_spacing(full_response)
                 message_placeholder.markdown(cleaned)
+                if chatbot.digest_hit is not None:
+                    st.caption(f"Precomputed answer from {chatbot.digest_hit['file']}.")
             st.session_state["messages"].append({"role": "assistant", "content": cleaned})
@@ -1,13 +1,38 @@
 from __future__ import annotations
 
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 
-from app.services.openai_client import chat_once
-from app.utils.pdf import extract_text_from_pdf
+from app.config.settings import settings
+from app.services.mongodb import (
+    fetch_metric_series,
+    get_cached_analysis,
+    list_metric_companies,
+    save_cached_analysis,
+    upsert_financial_metrics,
+)
+from app.services.openai_client import chat_once, embed_texts
+from app.utils.cache import LRUCache
+from app.utils.finance import group_pages, merge_partial_extractions, metrics_record, normalise_breakdown
+from app.utils.pdf import content_hash, extract_pages_from_pdf
+from app.utils.relevance import select_pages
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extraction prompt or its post-processing changes so that
+# cached analyses produced by the old prompt are no longer served.
+PROMPT_VERSION = "4"
+
+_analysis_cache = LRUCache(settings.analysis_cache_size)
+# Normalised breakdown tables keyed by the breakdown's canonical JSON.
+_breakdown_cache = LRUCache(settings.analysis_cache_size)
 
 
 def format_large_number(num):
@@ -23,9 +48,29 @@ def format_large_number(num):
         return f"${num:,.2f}"
 
 
-def parse_financial_data(text: str):
-    prompt = f"""
+REQUIRED_KEYS = [
+    "company_name",
+    "fiscal_year",
+    "fiscal_quarter",
+    "total_revenue",
+    "revenue_growth",
+    "operating_profit",
+    "operating_margin",
+    "net_income",
+    "earnings_per_share",
+    "operating_cash_flow",
+    "revenue_breakdown",
+]
+
+SYSTEM_PROMPT = "You are a highly skilled financial analyst AI that extracts and structures financial data accurately and comprehensively."
+
+
+def _extraction_prompt(text: str, excerpt_note: str = "") -> str:
+    return f"""
     Extract the following financial information from the given text:
+    - Company name
+    - Fiscal year the report covers (4-digit year)
+    - Fiscal quarter the report covers (1-4, or null for a full-year report)
     - Total revenue (in dollars)
     - Revenue growth (percentage)
     - Operating profit (in dollars)
@@ -36,7 +81,7 @@ def parse_financial_data(text: str):
     - Revenue breakdown: Provide a detailed breakdown of revenue by all available categories, segments, or product lines. Include ALL subcategories mentioned in the report.
 
     Text: {text}
-
+{excerpt_note}
     Provide the output as a JSON object with appropriate keys and values. 
     If you can't find a specific piece of information, use null for its value.
 
@@ -60,39 +105,256 @@ def parse_financial_data(text: str):
     Reply with the JSON object only. Don't give any explanations or comments. Just provide the structured JSON data.
     """
 
+
+def _excerpt_note(first_page: int, last_page: int) -> str:
+    keys = ", ".join(f'"{k}"' for k in REQUIRED_KEYS)
+    return f"""
+    The text above is only pages {first_page}-{last_page} of a longer report; each page starts with a "--- Page N ---" marker.
+    Only report values that are stated in these pages and use null for everything else.
+    Use exactly these keys: {keys}.
+    Also include a "source_pages" object mapping every key you filled in to the page number where you found it.
+"""
+
+
+def _parse_reply(response) -> Dict:
+    content = response.choices[0].message.content
+    content = content.replace("```json", "").replace("```", "").strip()
+    return json.loads(content)
+
+
+def parse_financial_data(text: str):
     try:
         response = chat_once([
-            {"role": "system", "content": "You are a highly skilled financial analyst AI that extracts and structures financial data accurately and comprehensively."},
-            {"role": "user", "content": prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": _extraction_prompt(text)},
         ])
-        content = response.choices[0].message.content
-        content = content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(content)
-        required_keys = [
-            "total_revenue",
-            "revenue_growth",
-            "operating_profit",
-            "operating_margin",
-            "net_income",
-            "earnings_per_share",
-            "operating_cash_flow",
-            "revenue_breakdown",
-        ]
-        for k in required_keys:
+        data = _parse_reply(response)
+        for k in REQUIRED_KEYS:
             data.setdefault(k, None)
         return data
     except Exception:
         return None
 
 
+def _extract_partial(first_page: int, last_page: int, text: str) -> Optional[Dict]:
+    try:
+        response = chat_once([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": _extraction_prompt(text, _excerpt_note(first_page, last_page))},
+        ])
+        return _parse_reply(response)
+    except Exception:
+        logger.exception("Financial extraction failed for pages %s-%s", first_page, last_page)
+        return None
+
+
+def parse_financial_data_map_reduce(pages: List[str], page_numbers: Optional[List[int]] = None) -> Optional[Dict]:
+    """Extract metrics from page groups concurrently and reconcile them into one result."""
+    groups = group_pages(pages, settings.map_reduce_chunk_chars, page_numbers)
+    with ThreadPoolExecutor(max_workers=max(1, settings.extraction_max_workers)) as pool:
+        futures = [pool.submit(_extract_partial, first, last, text) for first, last, text in groups]
+        partials = [(first, last, f.result()) for (first, last, _), f in zip(groups, futures)]
+    if all(data is None for _, _, data in partials):
+        return None
+    return merge_partial_extractions(partials, REQUIRED_KEYS)
+
+
+def analysis_cache_key(file) -> str:
+    return f"finance:{PROMPT_VERSION}:{settings.chat_model}:{settings.prefilter_token_budget}:{content_hash(file)}"
+
+
+def analyse_report(file, force: bool = False) -> Optional[Dict]:
+    """Return parsed financial data for a report, reusing earlier analyses of the same content."""
+    return _analyse(file, force)[0]
+
+
+def _analyse(file, force: bool = False) -> Tuple[Optional[Dict], Optional[bool]]:
+    """Parsed data plus the :func:`record_metrics` result for a fresh analysis (None when cached)."""
+    key = analysis_cache_key(file)
+    if not force:
+        data = _analysis_cache.get(key)
+        if data is not None:
+            return data, None
+        try:
+            data = get_cached_analysis(key)
+        except Exception:
+            logger.exception("Could not read cached analysis from MongoDB")
+            data = None
+        if data is not None:
+            _analysis_cache.set(key, data)
+            return data, None
+
+    pages = extract_pages_from_pdf(file)
+    embed = embed_texts if settings.prefilter_use_embeddings else None
+    # The budget caps the total sent to the model; it is set well above the
+    # map-reduce threshold so long reports are still split across calls.
+    keep = select_pages(pages, settings.prefilter_token_budget, embed=embed)
+    selected = [pages[i] for i in keep]
+    if sum(len(p) for p in selected) > settings.map_reduce_threshold_chars:
+        data = parse_financial_data_map_reduce(selected, [i + 1 for i in keep])
+    else:
+        data = parse_financial_data("\n".join(selected))
+    if data is not None:
+        _analysis_cache.set(key, data)
+        try:
+            save_cached_analysis(key, data)
+        except Exception:
+            logger.exception("Could not persist analysis to MongoDB")
+        return data, record_metrics(file, data)
+    return None, None
+
+
+def record_metrics(file, data: Dict) -> bool:
+    """Store the report's normalised metrics for the time-series view; False if its period is unknown."""
+    record = metrics_record(data, file.name, content_hash(file))
+    if record is None:
+        return False
+    try:
+        upsert_financial_metrics(record)
+    except Exception:
+        logger.exception("Could not store financial metrics for %s", file.name)
+        return False
+    return True
+
+
+def _analyse_and_record(file) -> Tuple[Optional[Dict], bool]:
+    data, stored = _analyse(file)
+    if data is not None and stored is None:
+        # Cached analyses may predate the metrics store, so (re)write their row.
+        stored = record_metrics(file, data)
+    return data, bool(stored)
+
+
+def _batch_analysis_ui():
+    uploaded_files = st.file_uploader(
+        "Upload quarterly financial reports (PDF)", type=["pdf"], accept_multiple_files=True
+    )
+    if not uploaded_files or not st.button("Analyse reports"):
+        return
+
+    progress = st.progress(0.0, text="Analysing reports...")
+    rows = []
+    with ThreadPoolExecutor(max_workers=max(1, settings.batch_max_workers)) as pool:
+        futures = {pool.submit(_analyse_and_record, f): f for f in uploaded_files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file = futures[future]
+            try:
+                data, stored = future.result()
+            except Exception:
+                logger.exception("Batch analysis failed for %s", file.name)
+                data, stored = None, False
+            if data is None:
+                status = "Extraction failed"
+            elif stored:
+                status = "Stored"
+            else:
+                status = "Company or period not found"
+            rows.append({
+                "report": file.name,
+                "company": (data or {}).get("company_name"),
+                "year": (data or {}).get("fiscal_year"),
+                "quarter": (data or {}).get("fiscal_quarter"),
+                "status": status,
+            })
+            progress.progress(done / len(uploaded_files), text=f"Analysed {done}/{len(uploaded_files)} reports")
+
+    st.dataframe(pd.DataFrame(rows).sort_values("report"), use_container_width=True)
+
+
+def breakdown_table(breakdown: Optional[Dict]) -> pd.DataFrame:
+    """Cached :func:`normalise_breakdown`; every breakdown chart is drawn from this table."""
+    if not isinstance(breakdown, dict):
+        return normalise_breakdown({})
+    key = json.dumps(breakdown, sort_keys=True, default=str)
+    table = _breakdown_cache.get(key)
+    if table is None:
+        table = normalise_breakdown(breakdown)
+        _breakdown_cache.set(key, table)
+    return table
+
+
+def _breakdown_charts(table: pd.DataFrame) -> None:
+    pie_tab, sunburst_tab, bar_tab, table_tab = st.tabs(["Pie", "Sunburst", "Bar", "Table"])
+    with pie_tab:
+        # Leaves only: parents are the sums of their children.
+        leaves = table[table["is_leaf"] & (table["value"] > 0)]
+        fig = px.pie(leaves, values="value", names="path", title="Revenue by Segment")
+        fig.update_traces(textposition="inside", textinfo="percent+label")
+        st.plotly_chart(fig, use_container_width=True)
+    with sunburst_tab:
+        if (table["value"] < 0).any():
+            st.info("The breakdown has negative amounts, which a sunburst cannot show.")
+        else:
+            fig = px.sunburst(table, ids="path", names="label", parents="parent", values="value", branchvalues="total")
+            st.plotly_chart(fig, use_container_width=True)
+    with bar_tab:
+        top = table[table["level"] == 1]
+        fig = px.bar(top, x="label", y="value", text=top["share_of_parent"].map("{:.1%}".format), title="Top-level segments")
+        fig.update_layout(xaxis_title=None, yaxis_title="Revenue")
+        st.plotly_chart(fig, use_container_width=True)
+    with table_tab:
+        st.dataframe(table, use_container_width=True, hide_index=True)
+
+
+def _trends_ui():
+    try:
+        companies = list_metric_companies()
+    except Exception as e:
+        logger.exception("Could not load companies")
+        st.error(f"Could not load stored metrics: {e}")
+        return
+    if not companies:
+        st.info("No stored metrics yet. Analyse some reports first.")
+        return
+
+    selected = st.multiselect("Companies", companies, default=companies[:1])
+    if not selected:
+        return
+    series = fetch_metric_series(selected)
+
+    frame = pd.DataFrame(
+        [{"company": row["company"], **point} for row in series for point in row["points"]]
+    )
+    if frame.empty:
+        st.info("No stored metrics for the selected companies.")
+        return
+    for column, title in (
+        ("total_revenue", "Total Revenue"),
+        ("operating_margin", "Operating Margin (%)"),
+        ("earnings_per_share", "Earnings Per Share ($)"),
+    ):
+        fig = px.line(frame, x="period", y=column, color="company", markers=True, title=title)
+        fig.update_xaxes(type="category")
+        st.plotly_chart(fig, use_container_width=True)
+
+    segments = pd.DataFrame([
+        {"company": row["company"], "period": point["period"], **segment}
+        for row in series for point in row["points"] for segment in point.get("segments") or []
+    ])
+    if not segments.empty:
+        company = st.selectbox("Segment revenue for", sorted(segments["company"].unique()))
+        fig = px.bar(segments[segments["company"] == company], x="period", y="value", color="segment",
+                     title="Revenue by Segment")
+        fig.update_xaxes(type="category")
+        st.plotly_chart(fig, use_container_width=True)
+
+
 def business_metrics_dashboard():
     st.title("Strategic Financial Intelligence Hub")
+    mode = st.radio("Mode", ("Single report", "Batch analysis", "Trends"), horizontal=True)
+    if mode == "Batch analysis":
+        _batch_analysis_ui()
+        return
+    if mode == "Trends":
+        _trends_ui()
+        return
+
     uploaded_file = st.file_uploader("Upload your quarterly financial report (PDF)", type=["pdf"])
 
     if uploaded_file is not None:
+        force = st.button("Re-analyse report")
         with st.spinner(" Processing the PDF..."):
-            text = extract_text_from_pdf(uploaded_file)
-            financial_data = parse_financial_data(text)
+            financial_data = analyse_report(uploaded_file, force=force)
 
         if financial_data:
             col1, col2, col3, col4 = st.columns(4)
@@ -122,17 +384,9 @@ def business_metrics_dashboard():
                 )
 
             st.subheader("Revenue Breakdown by Segments")
-            if financial_data["revenue_breakdown"]:
-                from app.utils.json_tools import flatten_dict
-
-                flattened_breakdown = flatten_dict(financial_data["revenue_breakdown"])
-                fig = px.pie(
-                    values=list(flattened_breakdown.values()),
-                    names=list(flattened_breakdown.keys()),
-                    title="Revenue by Segment",
-                )
-                fig.update_traces(textposition="inside", textinfo="percent+label")
-                st.plotly_chart(fig, use_container_width=True)
+            table = breakdown_table(financial_data["revenue_breakdown"])
+            if not table.empty:
+                _breakdown_charts(table)
             else:
                 st.info("No revenue breakdown data available.")
 
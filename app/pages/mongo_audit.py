@@ -4,44 +4,53 @@ import json
 import logging
 
 import streamlit as st
+from pymongo.errors import PyMongoError
 
-from app.services.mongodb import fetch_pdf_data, update_pdf_document
+from app.services.mongodb import apply_pdf_update
 from app.services.openai_client import chat_once
+from app.ui.paging import paged_pdf_documents
+from app.utils.json_patch import PROTECTED_FIELDS, PatchError, apply_patch, diff_to_update, validate_patch
 
 logger = logging.getLogger(__name__)
 
 
-def generate_modified_json(document, user_input):
+def generate_json_patch(document, user_input):
+    editable = {k: v for k, v in document.items() if k not in PROTECTED_FIELDS}
     prompt = f"""
     Given the following MongoDB document:
-    {json.dumps(document, indent=2)}
+    {json.dumps(editable, indent=2, default=str)}
 
     And the user's request to modify it:
     {user_input}
 
-    Generate the modified JSON document. Return only the modified JSON, without any explanation or additional text.
-    Ensure that you're modifying the correct fields and using appropriate data types.
-    If a field doesn't exist and needs to be added, add it to the appropriate place in the JSON structure.
-    If a field needs to be removed, remove it entirely.
-    Preserve any fields that don't need modification.
+    Return an RFC 6902 JSON Patch: a JSON array of operations such as
+    {{"op": "replace", "path": "/field/sub_field", "value": 42}},
+    {{"op": "add", "path": "/new_field", "value": "text"}} or {{"op": "remove", "path": "/old_field"}}.
+    Return only the JSON array, without any explanation or additional text.
+    Only include operations for the fields the user asked to change and use appropriate data types.
+    Paths use JSON Pointer syntax ("/" separated, "~1" for "/" and "~0" for "~" inside names).
     """
 
     try:
         response = chat_once([
-            {"role": "system", "content": "You are a helpful assistant that modifies JSON documents based on user instructions."},
+            {"role": "system", "content": "You are a helpful assistant that writes minimal JSON Patch documents based on user instructions."},
             {"role": "user", "content": prompt},
         ])
         content = response.choices[0].message.content.strip()
-        return json.loads(content)
+        content = content.replace("```json", "").replace("```", "").strip()
+        patch = json.loads(content)
+        if isinstance(patch, dict) and "patch" in patch:
+            patch = patch["patch"]
+        return validate_patch(patch)
     except Exception as e:
-        logger.exception("Error in generate_modified_json")
+        logger.exception("Error in generate_json_patch")
         raise
 
 
 def edit_mongodb_document():
     st.subheader("Edit MongoDB Document")
 
-    data = fetch_pdf_data(include_id=True)
+    data, offset = paged_pdf_documents("audit_cursors")
     if not data:
         st.info("No data available in MongoDB.")
         return
@@ -51,29 +60,57 @@ def edit_mongodb_document():
     df = pd.DataFrame(data)
     st.dataframe(df)
 
-    selected_index = st.selectbox("Select a document to edit", range(len(data)), format_func=lambda i: f"Document {i+1}")
+    selected_index = st.selectbox("Select a document to edit", range(len(data)), format_func=lambda i: f"Document {offset + i + 1}")
     selected_doc = data[selected_index]
 
     st.json(selected_doc)
 
     user_input = st.text_area("Describe the changes you want to make to this document:")
 
+    # The proposed edit survives the rerun triggered by the confirm button.
+    pending = st.session_state.get("audit_pending")
+    if pending and pending["doc_id"] != selected_doc["_id"]:
+        pending = st.session_state["audit_pending"] = None
+
     if st.button("Apply Changes"):
         if user_input:
             try:
-                modified_json = generate_modified_json(selected_doc, user_input)
-                st.subheader("Modified JSON:")
-                st.write(modified_json)
-
-                if st.button("Confirm and Update MongoDB"):
-                    ok = update_pdf_document(str(selected_doc["_id"]), modified_json)
-                    if ok:
-                        st.success("Document updated successfully!")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Failed to update the document in MongoDB.")
+                patch = generate_json_patch(selected_doc, user_input)
+                preview = apply_patch(selected_doc, patch)
+                pending = st.session_state["audit_pending"] = {
+                    "doc_id": selected_doc["_id"],
+                    "version": selected_doc.get("_version"),
+                    "patch": patch,
+                    "preview": preview,
+                    "update": diff_to_update(selected_doc, preview),
+                }
+            except PatchError as e:
+                st.error(f"The generated patch could not be applied: {e}")
             except Exception as e:
                 logger.exception("Error in edit_mongodb_document")
                 st.error(f"An error occurred: {str(e)}")
         else:
             st.warning("Please describe the changes you want to make.")
+
+    if pending:
+        st.subheader("Proposed patch:")
+        st.json(pending["patch"])
+        st.subheader("Modified JSON:")
+        st.json(pending["preview"])
+        if not pending["update"]:
+            st.info("The patch does not change the document.")
+            return
+        st.caption("MongoDB update to be applied:")
+        st.json(pending["update"])
+        if st.button("Confirm and Update MongoDB"):
+            try:
+                ok = apply_pdf_update(pending["doc_id"], pending["update"], pending["version"])
+            except PyMongoError as e:
+                st.error(f"MongoDB rejected the update: {e}")
+                return
+            st.session_state["audit_pending"] = None
+            if ok:
+                st.success("Document updated successfully!")
+                st.rerun()
+            else:
+                st.error("The document was changed by someone else since it was loaded. Please review it and try again.")
@@ -1,39 +1,112 @@
 from __future__ import annotations
 
 import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
 import streamlit as st
 from json2table import convert
 
-from app.services.mongodb import fetch_pdf_data
+from app.config.settings import settings
+from app.services.mongodb import get_pdf_document
+from app.ui.paging import paged_pdf_documents
+from app.utils.cache import LRUCache
+
+OVERVIEW = "Overview"
+
+
+@dataclass
+class ParsedContent:
+    """Parsed ``raw_content`` of one document version plus the HTML rendered from it so far."""
+
+    source: str
+    data: Any = None
+    error: Optional[str] = None
+    sections: List[Tuple[str, Any]] = field(default_factory=list)
+    html: Dict[str, str] = field(default_factory=dict)
+
+    def render(self, key: str, value: Any) -> str:
+        html = self.html.get(key)
+        if html is None:
+            html = self.html[key] = convert(value)
+        return html
+
+
+# Keyed by (document id, _version), so an edit in the audit page is never served stale.
+_content_cache = LRUCache(settings.viewer_cache_size)
+
+
+def _strip_fences(raw: str) -> str:
+    json_string = raw.replace("```json", "").strip("'''\"")
+    if json_string.endswith("```"):
+        json_string = json_string[:-3]
+    return json_string
+
+
+def _sections(data: Any) -> List[Tuple[str, Any]]:
+    """Top-level scalars grouped as an overview, then one section per nested value."""
+    if isinstance(data, list):
+        return [(f"Item {i + 1}", item if isinstance(item, dict) else {"value": item}) for i, item in enumerate(data)]
+    if not isinstance(data, dict):
+        return [(OVERVIEW, {"value": data})]
+    scalars = {k: v for k, v in data.items() if not isinstance(v, (dict, list))}
+    sections = [(OVERVIEW, scalars)] if scalars else []
+    sections += [(str(k), {k: v}) for k, v in data.items() if isinstance(v, (dict, list))]
+    return sections
+
+
+def parse_content(raw: str) -> ParsedContent:
+    source = _strip_fences(raw)
+    try:
+        data = json.loads(source)
+    except json.JSONDecodeError as e:
+        return ParsedContent(source, error=str(e))
+    return ParsedContent(source, data=data, sections=_sections(data))
+
+
+def _cached_content(document_id: Any, document: Dict) -> ParsedContent:
+    key = (str(document_id), document.get("_version"))
+    content = _content_cache.get(key)
+    if content is None:
+        content = parse_content(document["raw_content"])
+        _content_cache.set(key, content)
+    return content
 
 
 def db_image_page():
     st.header("MongoDB Document Viewer")
-    data = fetch_pdf_data(include_id=False)
+    page, offset = paged_pdf_documents("viewer_cursors", projection={"_id": 1})
 
-    if not data:
+    if not page:
         st.info("No data available in MongoDB.")
         return
 
-    document_ids = [f"Document {i + 1}" for i in range(len(data))]
-    selected_document = st.selectbox("Select a document to view:", document_ids)
-    selected_index = document_ids.index(selected_document)
-    st.subheader(selected_document)
-
-    if "raw_content" in data[selected_index]:
-        json_string = data[selected_index]["raw_content"].replace("```json", "").strip("'''\"")
-        if json_string.endswith("```"):
-            json_string = json_string[:-3]
-        try:
-            json_data = json.loads(json_string)
-            st.success("JSON string parsed successfully:")
-            table = convert(json_data)
-            st.write(table, unsafe_allow_html=True)
-        except json.JSONDecodeError as e:
-            st.error(f"Invalid JSON string: {e}")
+    labels = {d["_id"]: f"Document {offset + i + 1}" for i, d in enumerate(page)}
+    selected_id = st.selectbox("Select a document to view:", list(labels), format_func=labels.get)
+    st.subheader(labels[selected_id])
+
+    document = get_pdf_document(selected_id)
+    if document is None:
+        st.warning("This document no longer exists.")
+        return
+    document.pop("_id", None)
+
+    if "raw_content" in document:
+        content = _cached_content(selected_id, document)
+        if content.error is not None:
+            st.error(f"Invalid JSON string: {content.error}")
             st.write("JSON string that failed to parse:")
-            st.code(json_string)
+            st.code(content.source)
+        elif len(content.source) <= settings.viewer_inline_chars or len(content.sections) <= 1:
+            st.success("JSON string parsed successfully:")
+            st.write(content.render("all", content.data), unsafe_allow_html=True)
+        else:
+            st.success("JSON string parsed successfully. Open a section to render it:")
+            # Sections are only converted to HTML once opened, then reused from the cache.
+            for i, (name, value) in enumerate(content.sections):
+                if st.toggle(name, value=i == 0 and name == OVERVIEW, key=f"viewer_{selected_id}_{i}"):
+                    st.write(content.render(str(i), value), unsafe_allow_html=True)
     else:
-        st.json(data[selected_index])
+        st.json(document)
 
     st.markdown("---")
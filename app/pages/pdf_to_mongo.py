@@ -1,19 +1,27 @@
 from __future__ import annotations
 
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict
+
 import pandas as pd
 import streamlit as st
 
-from app.services.mongodb import insert_pdf_data, fetch_pdf_data
-from app.services.openai_client import chat_once
-from app.utils.pdf import extract_text_from_pdf
+from app.config.settings import settings
+from app.services.mongodb import bulk_insert_pdf_data, fetch_pdf_page, find_existing_hashes
+from app.services.openai_client import chat_once, embed_texts
+from app.utils.pdf import content_hash, extract_pages_from_pdf
+from app.utils.relevance import select_text
+
+logger = logging.getLogger(__name__)
 
 
 def extract_important_info(text: str):
     prompt = f"""
     Extract important information from the following text and organize it into a structured format:
 
-    {text[:2000]}
+    {text}
 
     Provide the output as a JSON object with appropriate keys and values.
     """
@@ -28,22 +36,72 @@ def extract_important_info(text: str):
         return {"raw_content": content}
 
 
+def _extract_file(file) -> Dict:
+    pages = extract_pages_from_pdf(file)
+    embed = embed_texts if settings.prefilter_use_embeddings else None
+    pdf_text = select_text(pages, settings.extract_info_token_budget, embed=embed)
+    return extract_important_info(pdf_text)
+
+
 def pdf_to_mongodb_page():
     st.header("PDF to MongoDB Converter")
-    uploaded_file = st.file_uploader("Upload a PDF file", type="pdf")
-
-    if uploaded_file is not None and st.button("Process PDF and Store in MongoDB"):
-        with st.spinner("Processing PDF and storing data..."):
-            pdf_text = extract_text_from_pdf(uploaded_file)
-            important_info = extract_important_info(pdf_text)
-            inserted_id = insert_pdf_data(important_info)
-            if inserted_id:
-                st.success(f"Data inserted successfully! Document ID: {inserted_id}")
-            else:
-                st.error("Failed to insert data into MongoDB.")
-            data = fetch_pdf_data(include_id=False)
-            if data:
-                st.subheader("Sample Data from MongoDB")
-                st.dataframe(pd.DataFrame(data))
-            else:
-                st.info("No data to display from MongoDB.")
+    uploaded_files = st.file_uploader("Upload PDF files", type="pdf", accept_multiple_files=True)
+
+    if uploaded_files and st.button("Process PDFs and Store in MongoDB"):
+        with st.spinner("Processing PDFs and storing data..."):
+            hashes = [content_hash(f) for f in uploaded_files]
+            known = find_existing_hashes(list(set(hashes)))
+            rows = [
+                {"file": f.name, "status": "already stored", "id": None, "error": None, "duplicate_of": None}
+                for f in uploaded_files
+            ]
+            # A file repeated within this upload points at the row of its first copy.
+            first = {h: hashes.index(h) for h in hashes}
+            for i, h in enumerate(hashes):
+                if first[h] != i and h not in known:
+                    rows[i].update(status="duplicate", duplicate_of=first[h])
+
+            # Only pay for extraction on content that is not stored yet; the
+            # upsert below still makes a duplicate upload harmless.
+            todo = [i for i, h in enumerate(hashes) if h not in known and first[h] == i]
+            docs = []
+            with ThreadPoolExecutor(max_workers=max(1, settings.batch_max_workers)) as pool:
+                futures = {pool.submit(_extract_file, uploaded_files[i]): i for i in todo}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        docs.append((i, {**future.result(), "source_hash": hashes[i], "source_name": uploaded_files[i].name}))
+                    except Exception as e:
+                        logger.exception("Extraction failed for %s", uploaded_files[i].name)
+                        rows[i].update(status="error", error=str(e))
+
+            docs.sort(key=lambda d: d[0])
+            try:
+                results = bulk_insert_pdf_data([d for _, d in docs])
+            except Exception as e:
+                # Raised before any batch was written, e.g. MongoDB is unreachable.
+                logger.exception("Storing extracted documents failed")
+                results = [{"status": "error", "id": None, "error": str(e)} for _ in docs]
+            for (i, _), result in zip(docs, results):
+                rows[i].update(status=result["status"], id=result["id"], error=result["error"])
+            for row in rows:
+                if row["duplicate_of"] is not None:
+                    original = rows[row["duplicate_of"]]
+                    row["id"] = original["id"]
+                    if original["status"] == "error":
+                        row.update(status="error", error=original["error"])
+
+        inserted = sum(r["status"] == "inserted" for r in rows)
+        failed = sum(r["status"] == "error" for r in rows)
+        if inserted:
+            st.success(f"Inserted {inserted} new document(s) into MongoDB.")
+        if failed:
+            st.error(f"{failed} file(s) could not be stored.")
+        st.dataframe(pd.DataFrame(rows))
+
+        data, _ = fetch_pdf_page(limit=settings.mongo_page_size, projection={"_id": 0})
+        if data:
+            st.subheader("Sample Data from MongoDB")
+            st.dataframe(pd.DataFrame(data))
+        else:
+            st.info("No data to display from MongoDB.")
@@ -1,40 +1,523 @@
 from __future__ import annotations
 
-from typing import List
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import chromadb
+import numpy as np
 from chromadb import PersistentClient
 
 from app.config.settings import settings
+from app.services import dedupe_index, digest
 from app.services.openai_client import embed_texts
+from app.services.resources import Resource
+from app.utils.cache import LRUCache
 
+logger = logging.getLogger(__name__)
 
-_client = None
+# Logical collection name -> Chroma collection currently serving it, for
+# collections that were re-embedded into a new physical collection.
+_registry: Optional[Dict[str, str]] = None
+_registry_lock = threading.RLock()
+# Held by writers; re-embedding takes it for the final catch-up and switch.
+_write_locks: Dict[str, threading.RLock] = {}
+
+# Facets per (collection, record count, alias count); any add or delete changes a count.
+_facet_cache = LRUCache(64)
+_bootstrap_attempted = False
+
+
+def _connect() -> chromadb.Client:
+    if settings.chroma_persist_dir:
+        return PersistentClient(path=settings.chroma_persist_dir)
+    return chromadb.Client()
+
+
+_resource = Resource("chroma", _connect, check=lambda client: client.heartbeat())
 
 
 def get_client() -> chromadb.Client:
-    global _client
-    if _client is None:
+    return _resource.get()
+
+
+def _registry_path() -> str:
+    return os.path.join(settings.chroma_persist_dir, "collections.json")
+
+
+def _load_registry() -> Dict[str, str]:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = {}
+            if settings.chroma_persist_dir and os.path.exists(_registry_path()):
+                with open(_registry_path(), encoding="utf-8") as f:
+                    _registry = json.load(f)
+        return _registry
+
+
+def physical_name(name: str) -> str:
+    """Chroma collection that currently serves the logical collection ``name``."""
+    return _load_registry().get(name, name)
+
+
+def switch_collection(name: str, physical: str) -> str:
+    """Atomically point ``name`` at another Chroma collection; returns the previous one."""
+    global _registry
+    # One lock across load, modify and write, so concurrent switches never drop each other's entries.
+    with _registry_lock:
+        registry = dict(_load_registry())
+        previous = registry.get(name, name)
+        if physical == name:
+            registry.pop(name, None)
+        else:
+            registry[name] = physical
         if settings.chroma_persist_dir:
-            _client = PersistentClient(path=settings.chroma_persist_dir)
+            os.makedirs(settings.chroma_persist_dir, exist_ok=True)
+            tmp = _registry_path() + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(registry, f)
+            os.replace(tmp, _registry_path())
+        _registry = registry
+    return previous
+
+
+def write_lock(name: str) -> threading.RLock:
+    with _registry_lock:
+        return _write_locks.setdefault(name, threading.RLock())
+
+
+def list_collection_names() -> List[str]:
+    """Logical collection names; shadow copies being re-embedded are hidden."""
+    registry = _load_registry()
+    names = []
+    for collection in get_client().list_collections():
+        shadow_of = (collection.metadata or {}).get("shadow_of")
+        if shadow_of:
+            if registry.get(shadow_of) == collection.name:
+                names.append(shadow_of)
+        elif collection.name not in registry:
+            names.append(collection.name)
+    return sorted(names)
+
+
+def drop_later(physical: str) -> None:
+    """Delete a Chroma collection that no longer serves any name after ``settings.collection_drop_grace`` seconds.
+
+    Requests that resolved it before it was replaced keep reading it meanwhile.
+    """
+    timer = threading.Timer(settings.collection_drop_grace, _drop_quietly, args=(physical,))
+    timer.daemon = True
+    timer.start()
+
+
+def _drop_quietly(physical: str) -> None:
+    try:
+        get_client().delete_collection(name=physical)
+    except Exception:
+        logger.warning("Could not remove previous collection %s", physical, exc_info=True)
+
+
+def remove_orphaned_collections() -> List[str]:
+    """Delete Chroma collections that serve no logical name; returns their names.
+
+    These are shadow copies of re-embedding jobs and staging copies of snapshot
+    imports left behind by a restart, and replaced collections whose delayed
+    delete never ran. Only safe while no such job is running.
+    """
+    registry = _load_registry()
+    client = get_client()
+    removed = []
+    for collection in client.list_collections():
+        shadow_of = (collection.metadata or {}).get("shadow_of")
+        if shadow_of:
+            orphaned = registry.get(shadow_of) != collection.name
         else:
-            _client = chromadb.Client()
-    return _client
+            orphaned = registry.get(collection.name, collection.name) != collection.name
+        if orphaned:
+            client.delete_collection(name=collection.name)
+            removed.append(collection.name)
+    return removed
+
+
+def bootstrap() -> None:
+    """Remove orphaned collections once per process at app start; failures are logged, not raised."""
+    global _bootstrap_attempted
+    if _bootstrap_attempted:
+        return
+    _bootstrap_attempted = True
+    try:
+        removed = remove_orphaned_collections()
+    except Exception:
+        logger.exception("Chroma orphan cleanup failed")
+        return
+    if removed:
+        logger.info("Removed orphaned Chroma collections: %s", ", ".join(removed))
 
 
 def get_or_create_collection(name: str):
     client = get_client()
-    return client.get_or_create_collection(name=name)
+    collection = client.get_or_create_collection(
+        name=physical_name(name), metadata={"embedding_model": settings.embedding_model}
+    )
+    if not (collection.metadata or {}).get("embedding_model"):
+        # Collections created before models were tagged are assumed to use the configured one.
+        metadata = {**(collection.metadata or {}), "embedding_model": settings.embedding_model}
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if sample is not None and len(sample):
+            metadata["embedding_dim"] = len(sample[0])
+        collection.modify(metadata=metadata)
+    return collection
+
+
+def collection_embedding(name: str) -> Tuple[str, Optional[int]]:
+    """Embedding model and vector dimension a collection was built with."""
+    metadata = get_or_create_collection(name).metadata or {}
+    return metadata["embedding_model"], metadata.get("embedding_dim")
+
+
+def _batch_ranges(chunks: Sequence[str], start: int, max_items: int, max_chars: int) -> List[Tuple[int, int]]:
+    """Consecutive ``(start, end)`` ranges from ``start`` with at most ``max_items`` chunks and ``max_chars`` characters."""
+    ranges = []
+    begin, chars = start, 0
+    for i in range(start, len(chunks)):
+        if i > begin and (i - begin >= max_items or chars + len(chunks[i]) > max_chars):
+            ranges.append((begin, i))
+            begin, chars = i, 0
+        chars += len(chunks[i])
+    if begin < len(chunks):
+        ranges.append((begin, len(chunks)))
+    return ranges
+
+
+def _checkpoint_path(collection_name: str) -> str:
+    return os.path.join(settings.chroma_persist_dir, "checkpoints", collection_name + ".json")
+
+
+def _upload_key(chunks: Sequence[str], ids: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for chunk_id, chunk in zip(ids, chunks):
+        digest.update(chunk_id.encode() + b"\0" + chunk.encode() + b"\0")
+    return digest.hexdigest()
+
+
+def _read_checkpoint(collection_name: str, key: str) -> int:
+    """Chunks of the upload ``key`` already stored by an earlier, interrupted call."""
+    path = _checkpoint_path(collection_name)
+    if not settings.chroma_persist_dir or not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    return checkpoint["done"] if checkpoint.get("key") == key else 0
+
+
+def _write_checkpoint(collection_name: str, key: str, done: int) -> None:
+    if not settings.chroma_persist_dir:
+        return
+    path = _checkpoint_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"key": key, "done": done}, f)
+    os.replace(path + ".tmp", path)
+
+
+def _clear_checkpoint(collection_name: str) -> None:
+    path = _checkpoint_path(collection_name)
+    if settings.chroma_persist_dir and os.path.exists(path):
+        os.remove(path)
+
+
+def _check_dimension(collection, collection_name: str, embeddings: List[np.ndarray]) -> None:
+    metadata = collection.metadata or {}
+    dim = len(embeddings[0])
+    if metadata.get("embedding_dim") is None:
+        collection.modify(metadata={**metadata, "embedding_dim": dim})
+    elif metadata["embedding_dim"] != dim:
+        raise ValueError(
+            f"Collection '{collection_name}' holds {metadata['embedding_dim']}-d vectors, "
+            f"got {dim}-d from {metadata['embedding_model']}"
+        )
+
+
+def _with_chunk_ids(ids: Sequence[str], metadatas: Optional[Sequence[Optional[Dict]]]) -> List[Dict]:
+    # Ids cannot be used in a ``where`` clause, so each chunk also carries its own.
+    if metadatas is None:
+        metadatas = [None] * len(ids)
+    return [{**(metadata or {}), "chunk_id": chunk_id} for chunk_id, metadata in zip(ids, metadatas)]
+
+
+def add_texts(
+    collection_name: str,
+    chunks: List[str],
+    ids: List[str],
+    metadatas: Optional[List[Dict]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+):
+    """Embed and store chunks in size-bounded batches.
+
+    The next batch is embedded while the current one is written. A checkpoint
+    is saved after every batch, so calling again with the same chunks after a
+    failure resumes after the last stored batch. ``progress(done, total)`` is
+    called after each batch.
+    """
+    with write_lock(collection_name):
+        collection = get_or_create_collection(collection_name)
+        model = collection.metadata["embedding_model"]
+        key = _upload_key(chunks, ids)
+        done = _read_checkpoint(collection_name, key)
+        max_items = min(settings.chroma_write_batch_size, get_client().get_max_batch_size())
+        ranges = _batch_ranges(chunks, done, max(1, max_items), settings.chroma_write_batch_chars)
+        if progress is not None:
+            progress(done, len(chunks))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(embed_texts, chunks[ranges[0][0] : ranges[0][1]], model) if ranges else None
+            for i, (start, end) in enumerate(ranges):
+                embeddings = pending.result()
+                if i + 1 < len(ranges):
+                    pending = pool.submit(embed_texts, chunks[ranges[i + 1][0] : ranges[i + 1][1]], model)
+                _check_dimension(collection, collection_name, embeddings)
+                # Upsert so re-adding a file replaces its chunks and their metadata.
+                collection.upsert(
+                    documents=chunks[start:end],
+                    embeddings=[e.tolist() for e in embeddings],
+                    ids=ids[start:end],
+                    metadatas=_with_chunk_ids(ids[start:end], metadatas[start:end] if metadatas is not None else None),
+                )
+                _write_checkpoint(collection_name, key, end)
+                if progress is not None:
+                    progress(end, len(chunks))
+        _clear_checkpoint(collection_name)
+
+
+def add_texts_deduplicated(
+    collection_name: str,
+    chunks: List[str],
+    ids: List[str],
+    metadatas: Optional[List[Dict]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Store only chunks that are not near-duplicates of stored ones; returns how many were skipped."""
+    plan = dedupe_index.plan(collection_name, chunks, ids, metadatas)
+    keep_chunks, keep_ids, keep_metadatas = dedupe_index.split_plan(chunks, ids, metadatas, plan)
+    if keep_chunks:
+        add_texts(collection_name, keep_chunks, keep_ids, keep_metadatas, progress=progress)
+    dedupe_index.commit(collection_name, plan)
+    return plan.skipped
+
+
+def delete_ids(collection_name: str, ids: List[str]) -> None:
+    """Delete chunks, promoting a reference chunk for every deleted canonical one still referenced."""
+    with write_lock(collection_name):
+        _delete_ids(collection_name, ids)
+
+
+def _delete_ids(collection_name: str, ids: List[str]) -> None:
+    collection = get_or_create_collection(collection_name)
+    orphans = dedupe_index.orphaned_aliases(collection_name, ids)
+    promoted: Dict[str, str] = {}
+    for alias, entry in sorted(orphans.items()):
+        if entry.get("document") is not None and entry["canonical"] not in promoted.values():
+            promoted[alias] = entry["canonical"]
+    if promoted:
+        # Near-duplicates share the canonical chunk's vector, so no new embedding call.
+        got = collection.get(ids=list(promoted.values()), include=["embeddings"])
+        vectors = dict(zip(got["ids"], got["embeddings"]))
+        promoted = {a: c for a, c in promoted.items() if c in vectors}
+        if promoted:
+            collection.add(
+                ids=list(promoted),
+                documents=[orphans[a]["document"] for a in promoted],
+                embeddings=[list(vectors[c]) for c in promoted.values()],
+                metadatas=_with_chunk_ids(list(promoted), [orphans[a].get("metadata") for a in promoted]),
+            )
+    stored = set(collection.get(ids=list(ids), include=[])["ids"]) if ids else set()
+    if stored:
+        collection.delete(ids=list(stored))
+    dedupe_index.forget(collection_name, ids, promoted)
+
+
+def delete_collection(collection_name: str) -> None:
+    with write_lock(collection_name):
+        client = get_client()
+        physical = physical_name(collection_name)
+        client.delete_collection(name=physical)
+        if physical != collection_name:
+            switch_collection(collection_name, collection_name)
+            # The collection it replaced may still await its delayed delete; it
+            # must not come back if the name is used again.
+            if collection_name in {c.name for c in client.list_collections()}:
+                client.delete_collection(name=collection_name)
+        forget_state(collection_name)
+
+
+def forget_state(collection_name: str) -> None:
+    """Drop the dedupe index, digest and ingest checkpoint kept beside a collection."""
+    dedupe_index.drop(collection_name)
+    digest.drop(collection_name)
+    _clear_checkpoint(collection_name)
+
+
+def chunk_metadata(file_name: str, page_start: int, page_end: int, doc_type: str, ingested: datetime) -> Dict:
+    return {
+        "file": file_name,
+        "page_start": page_start,
+        "page_end": page_end,
+        "doc_type": doc_type,
+        # Chroma range filters only work on numbers, so the date is also kept as epoch seconds.
+        "ingested_at": int(ingested.timestamp()),
+        "ingest_date": ingested.date().isoformat(),
+    }
+
+
+def _legacy_file(chunk_id: str) -> str:
+    # Chunks stored before metadata existed only carry the file in their id.
+    return chunk_id.split("_")[0]
+
+
+def list_files(collection_name: str) -> List[str]:
+    return collection_facets(collection_name)["files"]
+
+
+def collection_facets(collection_name: str) -> Dict:
+    """Distinct files and document types plus the highest page number, for filter widgets."""
+    collection = get_or_create_collection(collection_name)
+    aliases = dedupe_index.aliases(collection_name)
+    key = (collection_name, collection.count(), len(aliases))
+    facets = _facet_cache.get(key)
+    if facets is not None:
+        return facets
+    records = collection.get(include=["metadatas"])
+    files, doc_types, max_page = set(), set(), 0
+    entries = list(zip(records["ids"], records["metadatas"] or [None] * len(records["ids"])))
+    entries += [(k, v.get("metadata")) for k, v in aliases.items()]
+    for chunk_id, metadata in entries:
+        if metadata and metadata.get("file"):
+            files.add(metadata["file"])
+            doc_types.add(metadata.get("doc_type") or "other")
+            max_page = max(max_page, int(metadata.get("page_end") or 0))
+        else:
+            files.add(_legacy_file(chunk_id))
+    facets = {"files": sorted(files), "doc_types": sorted(doc_types), "max_page": max_page}
+    _facet_cache.set(key, facets)
+    return facets
+
+
+def file_chunk_ids(collection_name: str, file_name: str) -> List[str]:
+    """Ids of every chunk of ``file_name``, stored or aliased, with or without metadata."""
+    collection = get_or_create_collection(collection_name)
+    ids = set(collection.get(where={"file": file_name}, include=[])["ids"])
+    ids |= {i for i in collection.get(include=[])["ids"] if i.startswith(f"{file_name}_")}
+    for alias, entry in dedupe_index.aliases(collection_name).items():
+        metadata = entry.get("metadata") or {}
+        if metadata.get("file") == file_name or alias.startswith(f"{file_name}_"):
+            ids.add(alias)
+    return sorted(ids)
+
+
+def build_where(
+    files: Optional[Sequence[str]] = None,
+    doc_types: Optional[Sequence[str]] = None,
+    pages: Optional[Sequence[int]] = None,
+    dates: Optional[Sequence[date]] = None,
+) -> Optional[Dict]:
+    """Chroma ``where`` clause for the chat filters; None when nothing is filtered.
+
+    ``pages`` is an inclusive ``(first, last)`` page range and ``dates`` an
+    inclusive ``(first, last)`` ingest-date range.
+    """
+    clauses: List[Dict] = []
+    if files:
+        clauses.append({"file": {"$in": list(files)}})
+    if doc_types:
+        clauses.append({"doc_type": {"$in": list(doc_types)}})
+    if pages:
+        clauses.append({"page_end": {"$gte": int(pages[0])}})
+        clauses.append({"page_start": {"$lte": int(pages[1])}})
+    if dates:
+        start = datetime.combine(dates[0], time.min, tzinfo=timezone.utc)
+        end = datetime.combine(dates[-1], time.max, tzinfo=timezone.utc)
+        clauses.append({"ingested_at": {"$gte": int(start.timestamp())}})
+        clauses.append({"ingested_at": {"$lte": int(end.timestamp())}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+_OPERATORS: Dict[str, Callable[[object, object], bool]] = {
+    "$eq": lambda value, target: value == target,
+    "$ne": lambda value, target: value != target,
+    "$gt": lambda value, target: value is not None and value > target,
+    "$gte": lambda value, target: value is not None and value >= target,
+    "$lt": lambda value, target: value is not None and value < target,
+    "$lte": lambda value, target: value is not None and value <= target,
+    "$in": lambda value, target: value in target,
+    "$nin": lambda value, target: value not in target,
+}
+
+
+def _matches(metadata: Dict, where: Dict) -> bool:
+    """Evaluate a Chroma ``where`` clause against one metadata dict."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_OPERATORS[op](value, target) for op, target in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _resolve_aliases(collection, collection_name: str, where: Dict) -> Dict:
+    """Widen ``where`` to the stored chunks that stand in for matching near-duplicates.
+
+    An aliased chunk is only kept in the dedupe index, so its file, pages and
+    date are matched there and its canonical chunk is selected by id instead.
+    """
+    canonical = sorted({
+        entry["canonical"]
+        for entry in dedupe_index.aliases(collection_name).values()
+        if entry.get("metadata") and _matches(entry["metadata"], where)
+    })
+    if not canonical:
+        return where
+    stored = collection.get(ids=canonical, include=["metadatas"])
+    # Chunks stored before they carried their id get it now, on first use.
+    missing = [(i, m) for i, m in zip(stored["ids"], stored["metadatas"]) if not (m or {}).get("chunk_id")]
+    if missing:
+        collection.update(
+            ids=[i for i, _ in missing],
+            metadatas=_with_chunk_ids([i for i, _ in missing], [m for _, m in missing]),
+        )
+    return {"$or": [where, {"chunk_id": {"$in": canonical}}]}
 
 
-def add_texts(collection_name: str, chunks: List[str], ids: List[str]):
+def embed_query(collection_name: str, query_text: str) -> np.ndarray:
+    # Embed with the collection's own model; it keeps serving until a re-embedded copy replaces it.
     collection = get_or_create_collection(collection_name)
-    embeddings = embed_texts(chunks)
-    collection.add(documents=chunks, embeddings=[e.tolist() for e in embeddings], ids=ids)
+    return embed_texts([query_text], model=collection.metadata["embedding_model"])[0]
 
 
-def query(collection_name: str, query_text: str, k: int = 3) -> List[str]:
+def query(
+    collection_name: str,
+    query_text: str,
+    k: int = 3,
+    where: Optional[Dict] = None,
+    embedding: Optional[np.ndarray] = None,
+) -> List[str]:
     collection = get_or_create_collection(collection_name)
-    emb = embed_texts([query_text])[0]
-    results = collection.query(query_embeddings=[emb.tolist()], n_results=k)
+    emb = embedding if embedding is not None else embed_query(collection_name, query_text)
+    if where is not None:
+        where = _resolve_aliases(collection, collection_name, where)
+    results = collection.query(query_embeddings=[emb.tolist()], n_results=k, where=where)
     return results["documents"][0] if results and results.get("documents") else []
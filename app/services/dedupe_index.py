@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.utils.dedupe import LSHIndex, MinHasher
+
+_hasher = MinHasher(num_perm=settings.dedupe_num_perm)
+_indexes: Dict[str, "CollectionIndex"] = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class CollectionIndex:
+    """Near-duplicate state of one Chroma collection.
+
+    ``lsh`` holds signatures of the chunks stored in Chroma. ``aliases`` maps
+    the id of a chunk that was not stored, because it duplicates a stored one,
+    to ``{"canonical": id, "document": text, "metadata": dict}`` (reference mode only).
+    """
+
+    lsh: LSHIndex
+    aliases: Dict[str, Dict] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+@dataclass
+class DedupePlan:
+    keep: List[int]
+    signatures: Dict[str, np.ndarray]
+    aliases: Dict[str, Dict]
+
+    @property
+    def skipped(self) -> int:
+        return len(self.aliases)
+
+
+def index_path(collection_name: str) -> str:
+    """Base path of a collection's index files (``.npz`` signatures, ``.aliases.json``)."""
+    return os.path.join(settings.chroma_persist_dir or ".", "dedupe", collection_name)
+
+
+def _new_lsh() -> LSHIndex:
+    return LSHIndex(settings.dedupe_num_perm, settings.dedupe_bands, settings.dedupe_threshold)
+
+
+def _load(collection_name: str) -> CollectionIndex:
+    with _lock:
+        index = _indexes.get(collection_name)
+        if index is not None:
+            return index
+        index = CollectionIndex(_new_lsh())
+        base = index_path(collection_name)
+        if os.path.exists(base + ".npz"):
+            with np.load(base + ".npz") as data:
+                for key, signature in zip(data["ids"].tolist(), data["signatures"]):
+                    index.lsh.add(key, signature)
+        if os.path.exists(base + ".aliases.json"):
+            with open(base + ".aliases.json", encoding="utf-8") as f:
+                index.aliases = json.load(f)
+        _indexes[collection_name] = index
+        return index
+
+
+def _save(collection_name: str, index: CollectionIndex) -> None:
+    base = index_path(collection_name)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    keys, matrix = index.lsh.matrix()
+    # Write to temporary files and swap them in so a crash never leaves a torn index.
+    np.savez(base + ".tmp.npz", ids=np.array(keys, dtype=str), signatures=matrix)
+    os.replace(base + ".tmp.npz", base + ".npz")
+    with open(base + ".aliases.tmp.json", "w", encoding="utf-8") as f:
+        json.dump(index.aliases, f)
+    os.replace(base + ".aliases.tmp.json", base + ".aliases.json")
+
+
+def plan(
+    collection_name: str,
+    chunks: Sequence[str],
+    ids: Sequence[str],
+    metadatas: Optional[Sequence[Optional[Dict]]] = None,
+) -> DedupePlan:
+    """Decide which chunks to store; nothing is recorded until :func:`commit`.
+
+    Chunks are compared with the collection's stored chunks and with the ones
+    before them in the same call. A chunk whose id is already indexed is kept
+    (so retried uploads overwrite rather than alias themselves).
+    """
+    if settings.dedupe_mode not in ("skip", "reference"):
+        return DedupePlan(list(range(len(chunks))), {}, {})
+    index = _load(collection_name)
+    batch = _new_lsh()
+    keep: List[int] = []
+    signatures: Dict[str, np.ndarray] = {}
+    aliases: Dict[str, Dict] = {}
+    with index.lock:
+        for i, (chunk, chunk_id) in enumerate(zip(chunks, ids)):
+            signature = _hasher.signature(chunk)
+            match = None if chunk_id in index.lsh else index.lsh.query(signature) or batch.query(signature)
+            if match is None:
+                keep.append(i)
+                signatures[chunk_id] = signature
+                batch.add(chunk_id, signature)
+            elif settings.dedupe_mode == "reference":
+                metadata = metadatas[i] if metadatas is not None else None
+                aliases[chunk_id] = {"canonical": match[0], "document": chunk, "metadata": metadata}
+            else:
+                aliases[chunk_id] = {"canonical": match[0]}
+    return DedupePlan(keep, signatures, aliases)
+
+
+def commit(collection_name: str, result: DedupePlan) -> None:
+    """Record a plan once its chunks have been written to Chroma."""
+    if not result.signatures and not result.aliases:
+        return
+    index = _load(collection_name)
+    with index.lock:
+        for key, signature in result.signatures.items():
+            index.lsh.add(key, signature)
+        if settings.dedupe_mode == "reference":
+            index.aliases.update(result.aliases)
+        _save(collection_name, index)
+
+
+def aliases(collection_name: str) -> Dict[str, Dict]:
+    index = _load(collection_name)
+    with index.lock:
+        return {k: dict(v) for k, v in index.aliases.items()}
+
+
+def orphaned_aliases(collection_name: str, deleted_ids: Sequence[str]) -> Dict[str, Dict]:
+    """Aliases that survive a deletion but whose canonical chunk is being deleted."""
+    deleted = set(deleted_ids)
+    index = _load(collection_name)
+    with index.lock:
+        return {
+            alias: dict(entry)
+            for alias, entry in index.aliases.items()
+            if entry["canonical"] in deleted and alias not in deleted
+        }
+
+
+def forget(collection_name: str, deleted_ids: Sequence[str], promoted: Dict[str, str]) -> None:
+    """Drop deleted ids from the index.
+
+    ``promoted`` maps each alias that was written to Chroma in place of a deleted
+    canonical chunk to that canonical id; the remaining aliases of the canonical
+    are re-pointed at the promoted chunk.
+    """
+    deleted = set(deleted_ids)
+    index = _load(collection_name)
+    with index.lock:
+        index.lsh.remove(deleted)
+        replacement: Dict[str, str] = {}
+        for alias, canonical in promoted.items():
+            entry = index.aliases.pop(alias, None)
+            if entry is not None:
+                index.lsh.add(alias, _hasher.signature(entry["document"]))
+                replacement.setdefault(canonical, alias)
+        for alias in list(index.aliases):
+            entry = index.aliases[alias]
+            if alias in deleted:
+                del index.aliases[alias]
+            elif entry["canonical"] in replacement:
+                entry["canonical"] = replacement[entry["canonical"]]
+        _save(collection_name, index)
+
+
+def drop(collection_name: str) -> None:
+    with _lock:
+        _indexes.pop(collection_name, None)
+    base = index_path(collection_name)
+    for suffix in (".npz", ".aliases.json"):
+        if os.path.exists(base + suffix):
+            os.remove(base + suffix)
+
+
+def split_plan(
+    chunks: Sequence[str],
+    ids: Sequence[str],
+    metadatas: Optional[Sequence[Optional[Dict]]],
+    result: DedupePlan,
+) -> Tuple[List[str], List[str], Optional[List[Optional[Dict]]]]:
+    keep_metadatas = [metadatas[i] for i in result.keep] if metadatas is not None else None
+    return [chunks[i] for i in result.keep], [ids[i] for i in result.keep], keep_metadatas
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services.openai_client import chat_once, embed_texts
+from app.utils.relevance import select_text
+
+logger = logging.getLogger(__name__)
+
+_digests: Dict[str, "CollectionDigest"] = {}
+_lock = threading.Lock()
+
+DIGEST_PROMPT = """Read the document excerpt below and return JSON only, in this shape:
+{{"summary": "<3-5 sentence summary naming the company, period and key figures>",
+  "questions": [{{"question": "<question a reader is likely to ask>", "answer": "<short answer from the excerpt>"}}]}}
+Write {count} questions, each answerable from the excerpt on its own (name the company and period in it).
+Answer in plain text without markdown.
+
+Document: {name}
+Excerpt:
+{text}"""
+
+
+@dataclass
+class CollectionDigest:
+    """Per-file summaries and suggested Q/A of one collection.
+
+    ``vectors`` holds one embedding per :meth:`rows` entry, made with ``model``;
+    it is rebuilt when the files change or the collection's model does.
+    """
+
+    files: Dict[str, Dict] = field(default_factory=dict)
+    model: Optional[str] = None
+    vectors: Optional[np.ndarray] = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def rows(self) -> List[Tuple[str, int, str]]:
+        """``(file, question index or -1 for the summary, text)`` in a stable order."""
+        rows = []
+        for name in sorted(self.files):
+            entry = self.files[name]
+            rows.append((name, -1, entry["summary"]))
+            rows.extend((name, i, q["question"]) for i, q in enumerate(entry["questions"]))
+        return rows
+
+
+def digest_path(collection_name: str) -> str:
+    """Base path of a collection's digest files (``.json`` texts, ``.npz`` vectors)."""
+    return os.path.join(settings.chroma_persist_dir or ".", "digest", collection_name)
+
+
+def _load(collection_name: str) -> CollectionDigest:
+    with _lock:
+        digest = _digests.get(collection_name)
+        if digest is not None:
+            return digest
+        digest = CollectionDigest()
+        base = digest_path(collection_name)
+        if os.path.exists(base + ".json"):
+            with open(base + ".json", encoding="utf-8") as f:
+                digest.files = json.load(f)
+        if os.path.exists(base + ".npz"):
+            with np.load(base + ".npz") as data:
+                if len(data["vectors"]) == len(digest.rows()):
+                    digest.model, digest.vectors = str(data["model"]), data["vectors"]
+        _digests[collection_name] = digest
+        return digest
+
+
+def _save(collection_name: str, digest: CollectionDigest) -> None:
+    base = digest_path(collection_name)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    with open(base + ".tmp.json", "w", encoding="utf-8") as f:
+        json.dump(digest.files, f)
+    os.replace(base + ".tmp.json", base + ".json")
+    if digest.vectors is not None:
+        np.savez(base + ".tmp.npz", model=np.array(digest.model), vectors=digest.vectors)
+        os.replace(base + ".tmp.npz", base + ".npz")
+    elif os.path.exists(base + ".npz"):
+        os.remove(base + ".npz")
+
+
+def _ensure_vectors(collection_name: str, digest: CollectionDigest, model: str) -> Optional[np.ndarray]:
+    """Unit-length row vectors for ``model``, embedding all rows in one call if stale."""
+    if not digest.files:
+        return None
+    if digest.vectors is None or digest.model != model:
+        vectors = np.vstack(embed_texts([text for _, _, text in digest.rows()], model=model))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        digest.vectors = vectors / np.where(norms == 0, 1, norms)
+        digest.model = model
+        _save(collection_name, digest)
+    return digest.vectors
+
+
+def summarise_file(file_name: str, pages: Sequence[str]) -> Optional[Dict]:
+    """One LLM call for a file's summary and suggested questions; None on failure."""
+    text = select_text(pages, settings.digest_token_budget)
+    if not text.strip():
+        return None
+    try:
+        response = chat_once([
+            {"role": "user", "content": DIGEST_PROMPT.format(count=settings.digest_questions, name=file_name, text=text)},
+        ])
+        content = response.choices[0].message.content.replace("```json", "").replace("```", "").strip()
+        data = json.loads(content)
+        questions = [
+            {"question": str(q["question"]).strip(), "answer": str(q["answer"]).strip()}
+            for q in data.get("questions") or []
+            if isinstance(q, dict) and q.get("question") and q.get("answer")
+        ]
+        return {"summary": str(data["summary"]).strip(), "questions": questions}
+    except Exception:
+        logger.exception("Digest generation failed for %s", file_name)
+        return None
+
+
+def build_digests(pages_by_file: Dict[str, Sequence[str]]) -> Dict[str, Dict]:
+    """Summarise files concurrently, at most ``settings.digest_max_workers`` calls at a time."""
+    results: Dict[str, Dict] = {}
+    with ThreadPoolExecutor(max_workers=max(1, settings.digest_max_workers)) as pool:
+        futures = {pool.submit(summarise_file, name, pages): name for name, pages in pages_by_file.items()}
+        for future in as_completed(futures):
+            entry = future.result()
+            if entry is not None:
+                results[futures[future]] = entry
+    return results
+
+
+def add_files(collection_name: str, entries: Dict[str, Dict], model: str) -> None:
+    if not entries:
+        return
+    digest = _load(collection_name)
+    with digest.lock:
+        digest.files.update(entries)
+        digest.vectors = None
+        # Embed now so the first question does not pay for it.
+        _ensure_vectors(collection_name, digest, model)
+
+
+def forget_files(collection_name: str, file_names: Sequence[str]) -> None:
+    digest = _load(collection_name)
+    with digest.lock:
+        if any(digest.files.pop(name, None) is not None for name in list(file_names)):
+            digest.vectors = None
+            _save(collection_name, digest)
+
+
+def drop(collection_name: str) -> None:
+    with _lock:
+        _digests.pop(collection_name, None)
+    base = digest_path(collection_name)
+    for suffix in (".json", ".npz"):
+        if os.path.exists(base + suffix):
+            os.remove(base + suffix)
+
+
+def files(collection_name: str) -> Dict[str, Dict]:
+    digest = _load(collection_name)
+    with digest.lock:
+        return {name: dict(entry) for name, entry in digest.files.items()}
+
+
+def _scores(collection_name: str, vector: np.ndarray, model: str) -> List[Tuple[Tuple[str, int, str], float]]:
+    digest = _load(collection_name)
+    with digest.lock:
+        vectors = _ensure_vectors(collection_name, digest, model)
+        if vectors is None:
+            return []
+        query = vector / (np.linalg.norm(vector) or 1)
+        return list(zip(digest.rows(), (vectors @ query).tolist()))
+
+
+def match_question(collection_name: str, vector: np.ndarray, model: str) -> Optional[Dict]:
+    """Precomputed answer whose question is close enough to the query vector, or None."""
+    best = None
+    for (name, index, _), score in _scores(collection_name, vector, model):
+        if index >= 0 and score >= settings.digest_match_threshold and (best is None or score > best[1]):
+            best = ((name, index), score)
+    if best is None:
+        return None
+    (name, index), score = best
+    entry = files(collection_name)[name]["questions"][index]
+    return {**entry, "file": name, "score": score}
+
+
+def route_files(collection_name: str, vector: np.ndarray, model: str, all_files: Sequence[str]) -> Optional[List[str]]:
+    """Files whose summaries are closest to the query, for large collections.
+
+    Returns None (search everything) when the collection is small or some of
+    ``all_files`` have no summary, since routing would hide them.
+    """
+    summaries = {name: score for (name, index, _), score in _scores(collection_name, vector, model) if index < 0}
+    if len(summaries) < settings.digest_route_min_files or not set(all_files) <= set(summaries):
+        return None
+    return sorted(summaries, key=summaries.get, reverse=True)[: settings.digest_route_top_files]
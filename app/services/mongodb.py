@@ -1,63 +1,354 @@
 from __future__ import annotations
 
+import copy
 import logging
-from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
 
 from bson.objectid import ObjectId  # provided by pymongo (bundled with pymongo)
+from pymongo import ASCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
 from app.config.settings import settings
+from app.services.resources import Resource
+from app.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
 
-_client: Optional[MongoClient] = None
+_metrics_indexes_ready = False
+_indexes_ready = False
+_bootstrap_attempted = False
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Short-lived cache for pdf_data reads; cleared by every write made through this module.
+_pdf_cache = LRUCache(settings.mongo_cache_size, ttl=settings.mongo_cache_ttl)
+
+
+def _connect() -> MongoClient:
+    if not settings.mongodb_uri:
+        raise RuntimeError("MONGODB_URI is not set in environment")
+    client = MongoClient(
+        settings.mongodb_uri,
+        server_api=ServerApi("1"),
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        connectTimeoutMS=settings.mongo_connect_timeout_ms,
+        serverSelectionTimeoutMS=settings.mongo_connect_timeout_ms,
+        socketTimeoutMS=settings.mongo_socket_timeout_ms,
+    )
+    try:
+        client.admin.command("ping")
+    except Exception:
+        client.close()
+        raise
+    return client
+
+
+_resource = Resource(
+    "mongodb",
+    _connect,
+    check=lambda client: client.admin.command("ping"),
+    close=lambda client: client.close(),
+    configured=lambda: bool(settings.mongodb_uri),
+)
 
 
 def get_client() -> MongoClient:
-    global _client
-    if _client is None:
-        if not settings.mongodb_uri:
-            raise RuntimeError("MONGODB_URI is not set in environment")
-        _client = MongoClient(settings.mongodb_uri, server_api=ServerApi("1"))
+    return _resource.get()
+
+
+def ensure_indexes() -> None:
+    """Create the indexes the app relies on; cheap to call again once it has run."""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    client = get_client()
+    client.enterrag_db.pdf_data.create_index(
+        [("source_hash", ASCENDING)],
+        unique=True,
+        # Documents stored before content hashing existed have no source_hash.
+        partialFilterExpression={"source_hash": {"$exists": True}},
+        name="source_hash_unique",
+    )
+    ensure_metrics_indexes()
+    _indexes_ready = True
+
+
+def bootstrap() -> None:
+    """Run index creation once per process at app start; failures are logged, not raised."""
+    global _bootstrap_attempted
+    if _bootstrap_attempted:
+        return
+    _bootstrap_attempted = True
+    if not settings.mongodb_uri:
+        return
+    try:
+        ensure_indexes()
+    except Exception:
+        logger.exception("MongoDB index bootstrap failed")
+
+
+def _ingest_op(data: Dict, now: datetime) -> Tuple[object, Optional[ObjectId]]:
+    """Build the write for one document and, for plain inserts, the _id it will get."""
+    doc = dict(data)
+    source_hash = doc.pop("source_hash", None)
+    if source_hash is None:
+        doc.setdefault("_id", ObjectId())
+        return InsertOne({**doc, "ingested_at": now}), doc["_id"]
+    # Re-ingesting the same content keeps the stored (possibly audited) document
+    # and only records that it was seen again.
+    return UpdateOne(
+        {"source_hash": source_hash},
+        {"$setOnInsert": {**doc, "ingested_at": now}, "$set": {"last_ingested_at": now}},
+        upsert=True,
+    ), None
+
+
+def bulk_insert_pdf_data(docs: List[Dict], batch_size: Optional[int] = None) -> List[Dict]:
+    """Write many extractions with unordered bulk writes.
+
+    Documents carrying a ``source_hash`` are upserted on it, so re-ingesting the
+    same PDF never creates a second copy. Returns one ``{"index", "status", "id",
+    "error"}`` entry per input document, where status is ``inserted``, ``existing``
+    or ``error``. A failing document does not stop the rest of its batch, and a
+    batch that fails as a whole (network, timeout) only marks its own documents.
+    """
+    ensure_indexes()
+    client = get_client()
+    collection = client.enterrag_db.pdf_data
+    batch_size = batch_size or settings.mongo_bulk_batch_size
+    results: List[Dict] = []
+
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start : start + batch_size]
+        now = datetime.now(timezone.utc)
+        ops, preset_ids = zip(*(_ingest_op(d, now) for d in batch))
+        outcome = {i: {"index": start + i, "status": "existing", "id": None, "error": None} for i in range(len(batch))}
+        for i, _id in enumerate(preset_ids):
+            if _id is not None:
+                outcome[i].update(status="inserted", id=str(_id))
+
         try:
-            _client.admin.command("ping")
-            logger.info("Connected to MongoDB successfully")
-        except Exception as e:
-            logger.exception("Error connecting to MongoDB")
-            raise
-    return _client
+            res = collection.bulk_write(list(ops), ordered=False)
+            upserted = res.upserted_ids
+            errors = []
+        except BulkWriteError as e:
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+            errors = e.details.get("writeErrors", [])
+        except PyMongoError as e:
+            logger.warning("Bulk write of documents %d-%d failed: %s", start, start + len(batch) - 1, e)
+            upserted = {}
+            errors = [{"index": i, "errmsg": str(e)} for i in range(len(batch))]
+
+        for i, _id in upserted.items():
+            outcome[i].update(status="inserted", id=str(_id))
+        for err in errors:
+            i = err["index"]
+            if err.get("code") == DUPLICATE_KEY_ERROR and isinstance(ops[i], UpdateOne):
+                # Lost an upsert race with another writer of the same content.
+                continue
+            outcome[i].update(status="error", id=None, error=err.get("errmsg"))
+        results.extend(outcome[i] for i in range(len(batch)))
+
+    try:
+        _resolve_existing_ids(collection, docs, results)
+    except PyMongoError:
+        logger.warning("Could not look up ids of already stored documents", exc_info=True)
+    invalidate_pdf_cache()
+    return results
 
 
-def insert_pdf_data(data: Dict) -> Optional[str]:
+def _resolve_existing_ids(collection, docs: List[Dict], results: List[Dict]) -> None:
+    missing: Dict[str, List[Dict]] = {}
+    for r in results:
+        if r["status"] == "existing" and r["id"] is None:
+            missing.setdefault(docs[r["index"]]["source_hash"], []).append(r)
+    if not missing:
+        return
+    for doc in collection.find({"source_hash": {"$in": list(missing)}}, {"source_hash": 1}):
+        for r in missing[doc["source_hash"]]:
+            r["id"] = str(doc["_id"])
+
+
+def find_existing_hashes(hashes: List[str]) -> Set[str]:
     client = get_client()
-    db = client.enterrag_db
-    collection = db.pdf_data
-    result = collection.insert_one(data)
-    return str(result.inserted_id)
+    collection = client.enterrag_db.pdf_data
+    return {d["source_hash"] for d in collection.find({"source_hash": {"$in": hashes}}, {"source_hash": 1})}
+
+
+def apply_pdf_update(document_id: str, update: Dict, expected_version: Optional[int]) -> bool:
+    """Apply a ``$set``/``$unset`` update only if the document is still at ``expected_version``.
+
+    Every successful write bumps ``_version``; False means the document was changed
+    (or deleted) since it was read, and nothing was written.
+    """
+    client = get_client()
+    collection = client.enterrag_db.pdf_data
+    version_filter = {"$exists": False} if expected_version is None else expected_version
+    result = collection.update_one(
+        {"_id": ObjectId(document_id), "_version": version_filter},
+        {**update, "$inc": {"_version": 1}},
+    )
+    invalidate_pdf_cache()
+    logger.info("MongoDB patch matched=%s modified=%s", result.matched_count, result.modified_count)
+    return result.matched_count > 0
 
 
-def fetch_pdf_data(limit: int = 100, include_id: bool = True) -> List[Dict]:
+def invalidate_pdf_cache() -> None:
+    _pdf_cache.clear()
+
+
+def _stringify_id(doc: Dict) -> Dict:
+    if isinstance(doc.get("_id"), ObjectId):
+        doc["_id"] = str(doc["_id"])
+    return doc
+
+
+def _cached(key, load):
+    value = _pdf_cache.get(key)
+    if value is None:
+        value = load()
+        _pdf_cache.set(key, value)
+    # Callers may mutate what they get back; never hand out the cached object itself.
+    return copy.deepcopy(value)
+
+
+def fetch_pdf_page(
+    after_id: Optional[str] = None,
+    limit: int = 20,
+    projection: Optional[Dict] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Return one page of documents ordered by ``_id`` and the cursor for the next page.
+
+    Pages are keyset-paginated on ``_id`` (no skip), so every page costs the same
+    regardless of how deep into the collection it is. The returned cursor is None
+    on the last page.
+    """
+    def load():
+        client = get_client()
+        collection = client.enterrag_db.pdf_data
+        query = {"_id": {"$gt": ObjectId(after_id)}} if after_id else {}
+        # The cursor needs _id even when the caller excludes it from the result.
+        hide_id = bool(projection) and projection.get("_id") == 0
+        fields = {k: v for k, v in (projection or {}).items() if k != "_id"} if hide_id else projection
+        docs = list(collection.find(query, fields or None).sort("_id", ASCENDING).limit(limit + 1))
+        has_next = len(docs) > limit
+        docs = [_stringify_id(d) for d in docs[:limit]]
+        next_cursor = docs[-1]["_id"] if has_next and docs else None
+        if hide_id:
+            for d in docs:
+                d.pop("_id", None)
+        return docs, next_cursor
+
+    key = ("page", after_id, limit, tuple(sorted((projection or {}).items())))
+    return _cached(key, load)
+
+
+def estimate_pdf_count() -> int:
+    """Fast, metadata-based document count (may lag slightly behind concurrent writes)."""
+    def load():
+        client = get_client()
+        return client.enterrag_db.pdf_data.estimated_document_count()
+
+    return _cached(("count",), load)
+
+
+def get_pdf_document(document_id: str) -> Optional[Dict]:
+    def load():
+        client = get_client()
+        doc = client.enterrag_db.pdf_data.find_one({"_id": ObjectId(document_id)})
+        return _stringify_id(doc) if doc else None
+
+    return _cached(("doc", document_id), load)
+
+
+def get_cached_analysis(cache_key: str) -> Optional[Dict]:
     client = get_client()
     db = client.enterrag_db
-    collection = db.pdf_data
-    projection = None if include_id else {"_id": 0}
-    docs = list(collection.find({}, projection).limit(limit))
-    # Ensure ObjectId is stringified for Streamlit display
-    if include_id:
-        for d in docs:
-            if isinstance(d.get("_id"), ObjectId):
-                d["_id"] = str(d["_id"])  # type: ignore
-    return docs
+    doc = db.analysis_cache.find_one({"_id": cache_key}, {"data": 1})
+    return doc["data"] if doc else None
 
 
-def update_pdf_document(document_id: str, updated_document: Dict) -> bool:
+def save_cached_analysis(cache_key: str, data: Dict) -> None:
     client = get_client()
     db = client.enterrag_db
-    collection = db.pdf_data
-    updated = dict(updated_document)
-    updated.pop("_id", None)
-    result = collection.update_one({"_id": ObjectId(document_id)}, {"$set": updated})
-    logger.info("MongoDB update modified_count=%s", result.modified_count)
-    return result.modified_count > 0
+    db.analysis_cache.replace_one(
+        {"_id": cache_key},
+        {"_id": cache_key, "data": data, "created_at": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+
+
+def ensure_metrics_indexes() -> None:
+    global _metrics_indexes_ready
+    if _metrics_indexes_ready:
+        return
+    client = get_client()
+    collection = client.enterrag_db.financial_metrics
+    collection.create_index(
+        [("company_key", ASCENDING), ("fiscal_year", ASCENDING), ("fiscal_quarter", ASCENDING)],
+        unique=True,
+        name="company_period_unique",
+    )
+    collection.create_index([("company_key", ASCENDING), ("period_sort", ASCENDING)], name="company_series")
+    _metrics_indexes_ready = True
+
+
+def upsert_financial_metrics(metrics: Dict) -> None:
+    """Store one company/period row; re-analysing the same period overwrites it."""
+    ensure_metrics_indexes()
+    client = get_client()
+    collection = client.enterrag_db.financial_metrics
+    key = {k: metrics[k] for k in ("company_key", "fiscal_year", "fiscal_quarter")}
+    collection.update_one(
+        key,
+        {"$set": {**metrics, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def list_metric_companies() -> List[str]:
+    """One display name per company key ("Meta" and "META" are the same company)."""
+    client = get_client()
+    collection = client.enterrag_db.financial_metrics
+    rows = collection.aggregate([
+        {"$sort": {"company_key": 1, "period_sort": -1}},
+        {"$group": {"_id": "$company_key", "company": {"$first": "$company"}}},
+    ])
+    return sorted(row["company"] for row in rows)
+
+
+def fetch_metric_series(companies: Optional[List[str]] = None) -> List[Dict]:
+    """Return one ``{"company", "points"}`` row per company with its periods in order."""
+    client = get_client()
+    collection = client.enterrag_db.financial_metrics
+    pipeline: List[Dict] = []
+    if companies:
+        pipeline.append({"$match": {"company_key": {"$in": [c.casefold() for c in companies]}}})
+    pipeline += [
+        {"$sort": {"company_key": 1, "period_sort": 1}},
+        {
+            "$group": {
+                "_id": "$company_key",
+                # Latest spelling, matching list_metric_companies.
+                "company": {"$last": "$company"},
+                "points": {
+                    "$push": {
+                        "period": "$period",
+                        "total_revenue": "$total_revenue",
+                        "operating_margin": "$operating_margin",
+                        "net_income": "$net_income",
+                        "earnings_per_share": "$earnings_per_share",
+                        "segments": "$segments",
+                    }
+                },
+            }
+        },
+        {"$project": {"_id": 0, "company": 1, "points": 1}},
+        {"$sort": {"company": 1}},
+    ]
+    return list(collection.aggregate(pipeline))
@@ -1,21 +1,48 @@
-from typing import List
+from typing import List, Optional
+import httpx
 import numpy as np
-from openai import OpenAI
+from openai import APIStatusError, DefaultHttpxClient, OpenAI
 from app.config.settings import settings
+from app.services.resources import Resource
 
-_client = None
+
+def _connect() -> OpenAI:
+    limits = httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_connections,
+    )
+    return OpenAI(
+        api_key=settings.openai_api_key,
+        timeout=settings.openai_timeout,
+        max_retries=settings.openai_max_retries,
+        http_client=DefaultHttpxClient(limits=limits),
+    )
+
+
+def _check(client: OpenAI) -> None:
+    try:
+        client.models.retrieve(settings.chat_model)
+    except APIStatusError:
+        # The API answered (403 on restricted keys, 404, 429...), so the connection is alive.
+        pass
+
+
+_resource = Resource(
+    "openai",
+    _connect,
+    check=_check,
+    close=lambda client: client.close(),
+    configured=lambda: bool(settings.openai_api_key),
+)
 
 
 def get_openai_client() -> OpenAI:
-    global _client
-    if _client is None:
-        _client = OpenAI(api_key=settings.openai_api_key)
-    return _client
+    return _resource.get()
 
 
-def embed_texts(texts: List[str]) -> List[np.ndarray]:
+def embed_texts(texts: List[str], model: Optional[str] = None) -> List[np.ndarray]:
     client = get_openai_client()
-    resp = client.embeddings.create(model=settings.embedding_model, input=texts)
+    resp = client.embeddings.create(model=model or settings.embedding_model, input=texts)
     return [np.array(d.embedding) for d in resp.data]
 
 
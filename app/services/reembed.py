@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.chroma_store import drop_later, get_client, physical_name, switch_collection, write_lock
+from app.services.openai_client import embed_texts
+
+logger = logging.getLogger(__name__)
+
+_jobs: Dict[str, "ReembedJob"] = {}
+_lock = threading.Lock()
+
+
+class ReembedCancelled(Exception):
+    pass
+
+
+@dataclass
+class ReembedJob:
+    """Progress of re-embedding ``collection`` from ``source`` into the shadow ``target``."""
+
+    collection: str
+    model: str
+    source: str
+    target: str
+    total: int = 0
+    done: int = 0
+    status: str = "running"
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+
+def job_status(collection_name: str) -> Optional[ReembedJob]:
+    return _jobs.get(collection_name)
+
+
+def start_reembedding(collection_name: str, model: Optional[str] = None) -> ReembedJob:
+    """Start rebuilding a collection with ``model`` in the background; returns the running job.
+
+    The collection keeps answering queries with its current vectors until the
+    rebuilt copy is complete and switched in.
+    """
+    model = model or settings.embedding_model
+    with _lock:
+        job = _jobs.get(collection_name)
+        if job is not None and job.running:
+            return job
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        job = ReembedJob(collection_name, model, physical_name(collection_name), f"{collection_name}__{stamp}")
+        _jobs[collection_name] = job
+    threading.Thread(target=_run, args=(job,), name=f"reembed-{collection_name}", daemon=True).start()
+    return job
+
+
+def cancel_reembedding(collection_name: str) -> None:
+    job = _jobs.get(collection_name)
+    if job is not None:
+        job.cancel_event.set()
+
+
+def _copy(job: ReembedJob, source, target, ids: List[str]) -> None:
+    batch_size = max(1, settings.reembed_batch_size)
+    for start in range(0, len(ids), batch_size):
+        if job.cancel_event.is_set():
+            raise ReembedCancelled()
+        page = source.get(ids=ids[start : start + batch_size], include=["documents", "metadatas"])
+        if not page["ids"]:
+            continue
+        vectors = embed_texts(page["documents"], model=job.model)
+        if (target.metadata or {}).get("embedding_dim") is None:
+            target.modify(metadata={**(target.metadata or {}), "embedding_dim": len(vectors[0])})
+        target.upsert(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=[v.tolist() for v in vectors],
+        )
+        job.done += len(page["ids"])
+        # Throttle so a rebuild does not starve interactive embedding calls.
+        time.sleep(settings.reembed_pause_seconds)
+
+
+def _diff(source, target) -> Tuple[List[str], List[str]]:
+    source_ids = set(source.get(include=[])["ids"])
+    target_ids = set(target.get(include=[])["ids"])
+    return sorted(source_ids - target_ids), sorted(target_ids - source_ids)
+
+
+def _run(job: ReembedJob) -> None:
+    client = get_client()
+    target = None
+    try:
+        source = client.get_collection(name=job.source)
+        target = client.create_collection(
+            name=job.target, metadata={"embedding_model": job.model, "shadow_of": job.collection}
+        )
+        ids = source.get(include=[])["ids"]
+        job.total = len(ids)
+        _copy(job, source, target, ids)
+        # Catch up with chunks added or deleted meanwhile, then once more with
+        # writers paused so nothing lands between the last copy and the switch.
+        for final in (False, True):
+            with write_lock(job.collection) if final else nullcontext():
+                missing, extra = _diff(source, target)
+                job.total += len(missing)
+                _copy(job, source, target, missing)
+                if extra:
+                    target.delete(ids=extra)
+                if final:
+                    if physical_name(job.collection) != job.source:
+                        raise RuntimeError("The collection was replaced while it was being re-embedded")
+                    switch_collection(job.collection, job.target)
+    except Exception as e:
+        job.status = "cancelled" if isinstance(e, ReembedCancelled) else "failed"
+        job.error = None if isinstance(e, ReembedCancelled) else str(e)
+        if job.status == "failed":
+            logger.exception("Re-embedding collection %s failed", job.collection)
+        if target is not None:
+            try:
+                client.delete_collection(name=job.target)
+            except Exception:
+                logger.warning("Could not remove shadow collection %s", job.target, exc_info=True)
+        return
+
+    job.status = "done"
+    drop_later(job.source)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_resources: Dict[str, "Resource"] = {}
+_monitor: Optional[threading.Thread] = None
+_monitor_lock = threading.Lock()
+
+
+class ResourceUnavailable(RuntimeError):
+    pass
+
+
+class Resource:
+    """A client shared by every Streamlit session in the process.
+
+    The client is created on first use (or at warm-up), checked periodically by
+    the monitor thread, and dropped when a check fails so the next caller
+    reconnects. Failed connection attempts back off exponentially instead of
+    being retried on every request.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        check: Callable[[Any], Any],
+        close: Optional[Callable[[Any], Any]] = None,
+        configured: Callable[[], bool] = lambda: True,
+    ):
+        self.name = name
+        self._factory = factory
+        self._check = check
+        self._close = close
+        self.configured = configured
+        self._client: Any = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self.last_error: Optional[str] = None
+        _resources[name] = self
+
+    def get(self) -> Any:
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                now = time.monotonic()
+                if now < self._retry_at:
+                    raise ResourceUnavailable(
+                        f"{self.name} is unavailable (retrying in {self._retry_at - now:.0f}s): {self.last_error}"
+                    )
+                try:
+                    self._client = self._factory()
+                except Exception as e:
+                    self._failures += 1
+                    delay = min(settings.resource_backoff_max, settings.resource_backoff_base * 2 ** (self._failures - 1))
+                    self._retry_at = now + delay
+                    self.last_error = str(e)
+                    logger.warning("Connecting to %s failed, next attempt in %.0fs: %s", self.name, delay, e)
+                    raise
+                self._failures = 0
+                self._retry_at = 0.0
+                self.last_error = None
+                logger.info("Connected to %s", self.name)
+            return self._client
+
+    def check(self) -> bool:
+        """Run the liveness check on an existing client; a failing client is discarded."""
+        client = self._client
+        if client is None:
+            return False
+        try:
+            self._check(client)
+            return True
+        except Exception as e:
+            logger.warning("%s failed its health check, reconnecting on next use: %s", self.name, e)
+            self.last_error = str(e)
+            self.reset(client)
+            return False
+
+    def reset(self, client: Any = None) -> None:
+        """Drop the client (only if it is still ``client``, when given) so the next caller reconnects.
+
+        Requests already running keep using the old client, so it is only
+        closed after ``settings.resource_close_grace`` seconds.
+        """
+        with self._lock:
+            if self._client is None or (client is not None and self._client is not client):
+                return
+            client, self._client = self._client, None
+        if self._close is not None:
+            timer = threading.Timer(settings.resource_close_grace, self._close_quietly, args=(client,))
+            timer.daemon = True
+            timer.start()
+
+    def _close_quietly(self, client: Any) -> None:
+        try:
+            self._close(client)
+        except Exception:
+            logger.debug("Closing %s failed", self.name, exc_info=True)
+
+
+def _monitor_loop() -> None:
+    for resource in list(_resources.values()):
+        if resource.configured():
+            try:
+                resource.get()
+            except Exception:
+                pass
+    while True:
+        time.sleep(settings.resource_health_interval)
+        for resource in list(_resources.values()):
+            if not resource.configured():
+                continue
+            if not resource.check():
+                try:
+                    resource.get()
+                except Exception:
+                    pass
+
+
+def warm_up() -> None:
+    """Connect every configured client in the background and start health checks; runs once per process."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            return
+        _monitor = threading.Thread(target=_monitor_loop, name="resource-monitor", daemon=True)
+        _monitor.start()
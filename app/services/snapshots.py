@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.config.settings import settings
+from app.services import dedupe_index
+from app.services.chroma_store import (
+    drop_later,
+    forget_state,
+    get_client,
+    list_collection_names,
+    physical_name,
+    switch_collection,
+    write_lock,
+)
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+RECORDS = "records.jsonl"
+EMBEDDINGS = "embeddings.npy"
+# Near-duplicate index files, copied along when the collection has them.
+DEDUPE_FILES = {"dedupe.npz": ".npz", "dedupe.aliases.json": ".aliases.json"}
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_snapshots() -> List[str]:
+    root = settings.snapshot_dir
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        (d for d in os.listdir(root) if os.path.exists(os.path.join(root, d, MANIFEST))),
+        reverse=True,
+    )
+
+
+def read_manifest(path: str) -> Dict:
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_collection(collection_name: str, path: Optional[str] = None) -> str:
+    """Write a collection to a snapshot directory and return its path.
+
+    The directory holds ``records.jsonl`` (ids, documents, metadata), a float32
+    ``embeddings.npy`` matrix that can be memory-mapped, and a manifest with
+    SHA-256 checksums of every file.
+    """
+    collection = get_client().get_collection(name=physical_name(collection_name))
+    if path is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(settings.snapshot_dir, f"{collection_name}-{stamp}")
+    os.makedirs(path, exist_ok=False)
+
+    count = collection.count()
+    page_size = settings.snapshot_page_size
+    matrix = None
+    written = 0
+    with open(os.path.join(path, RECORDS), "w", encoding="utf-8") as records:
+        for offset in range(0, count, page_size):
+            page = collection.get(
+                limit=page_size, offset=offset, include=["documents", "metadatas", "embeddings"]
+            )
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    os.path.join(path, EMBEDDINGS), mode="w+", dtype=np.float32, shape=(count, vectors.shape[1])
+                )
+            matrix[written : written + len(vectors)] = vectors
+            for i, doc_id in enumerate(page["ids"]):
+                records.write(json.dumps({
+                    "id": doc_id,
+                    "document": page["documents"][i],
+                    "metadata": page["metadatas"][i],
+                }) + "\n")
+            written += len(vectors)
+    if matrix is None:
+        np.save(os.path.join(path, EMBEDDINGS), np.zeros((0, 0), dtype=np.float32))
+        dim = 0
+    else:
+        dim = int(matrix.shape[1])
+        matrix.flush()
+        del matrix
+    if written != count:
+        raise SnapshotError(f"Collection changed during export ({written} of {count} records read)")
+
+    dedupe_base = dedupe_index.index_path(collection_name)
+    for name, suffix in DEDUPE_FILES.items():
+        if os.path.exists(dedupe_base + suffix):
+            shutil.copyfile(dedupe_base + suffix, os.path.join(path, name))
+
+    files = [RECORDS, EMBEDDINGS] + [n for n in DEDUPE_FILES if os.path.exists(os.path.join(path, n))]
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "collection": collection_name,
+        "collection_metadata": {k: v for k, v in (collection.metadata or {}).items() if k != "shadow_of"},
+        "count": count,
+        "dim": dim,
+        "dtype": "float32",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "checksums": {name: _sha256(os.path.join(path, name)) for name in files},
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def verify_snapshot(path: str) -> Dict:
+    manifest = read_manifest(path)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {manifest.get('format_version')!r}")
+    for name, expected in manifest["checksums"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or _sha256(file_path) != expected:
+            raise SnapshotError(f"Checksum mismatch for {name}")
+    return manifest
+
+
+def import_snapshot(path: str, collection_name: Optional[str] = None, overwrite: bool = False) -> int:
+    """Bulk-load a snapshot into Chroma without any embedding calls; returns the record count.
+
+    Records are loaded into a hidden staging collection that only replaces the
+    existing one once every record is in, so a failed import leaves it intact.
+    """
+    manifest = verify_snapshot(path)
+    collection_name = collection_name or manifest["collection"]
+    if not overwrite and collection_name in list_collection_names():
+        raise SnapshotError(f"Collection '{collection_name}' already exists")
+    client = get_client()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    staging = f"{collection_name}__import{stamp}"
+    collection = client.create_collection(
+        name=staging, metadata={**(manifest.get("collection_metadata") or {}), "shadow_of": collection_name}
+    )
+    try:
+        count = _load_records(path, manifest, collection, client.get_max_batch_size())
+        with write_lock(collection_name):
+            exists = collection_name in list_collection_names()
+            if exists and not overwrite:
+                raise SnapshotError(f"Collection '{collection_name}' already exists")
+            previous = switch_collection(collection_name, staging)
+    except BaseException:
+        try:
+            client.delete_collection(name=staging)
+        except Exception:
+            logger.warning("Could not remove staging collection %s", staging, exc_info=True)
+        raise
+
+    if exists:
+        drop_later(previous)
+    forget_state(collection_name)
+    dedupe_base = dedupe_index.index_path(collection_name)
+    for name, suffix in DEDUPE_FILES.items():
+        if os.path.exists(os.path.join(path, name)):
+            os.makedirs(os.path.dirname(dedupe_base), exist_ok=True)
+            shutil.copyfile(os.path.join(path, name), dedupe_base + suffix)
+    return count
+
+
+def _load_records(path: str, manifest: Dict, collection, max_batch_size: int) -> int:
+    matrix = np.load(os.path.join(path, EMBEDDINGS), mmap_mode="r")
+    batch_size = min(settings.snapshot_page_size, max_batch_size)
+    ids: List[str] = []
+    documents: List[str] = []
+    metadatas: List[Optional[Dict]] = []
+    start = 0
+
+    def flush() -> None:
+        nonlocal start
+        if not ids:
+            return
+        collection.add(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=np.asarray(matrix[start : start + len(ids)]),
+        )
+        start += len(ids)
+        ids.clear()
+        documents.clear()
+        metadatas.clear()
+
+    with open(os.path.join(path, RECORDS), encoding="utf-8") as records:
+        for line in records:
+            record = json.loads(line)
+            ids.append(record["id"])
+            documents.append(record["document"])
+            metadatas.append(record["metadata"])
+            if len(ids) >= batch_size:
+                flush()
+    flush()
+    if start != manifest["count"]:
+        raise SnapshotError(f"Snapshot holds {start} records but its manifest lists {manifest['count']}")
+    return start
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from app.config.settings import settings
+from app.services.mongodb import estimate_pdf_count, fetch_pdf_page
+
+
+def paged_pdf_documents(key: str, projection: Optional[Dict] = None) -> Tuple[List[Dict], int]:
+    """Render Previous/Next controls and return the current page of pdf_data plus its offset.
+
+    The stack of page cursors lives in ``st.session_state[key]`` so each page keeps
+    its own position across reruns.
+    """
+    cursors: List[Optional[str]] = st.session_state.setdefault(key, [None])
+    page_size = settings.mongo_page_size
+    docs, next_cursor = fetch_pdf_page(cursors[-1], page_size, projection)
+    offset = (len(cursors) - 1) * page_size
+
+    total = estimate_pdf_count()
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        if st.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with info_col:
+        pages = max(1, math.ceil(total / page_size))
+        st.caption(f"Page {len(cursors)} of ~{pages} ({total} documents)")
+    with next_col:
+        if st.button("Next", key=f"{key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+    return docs, offset
+
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, k: int = 5) -> np.ndarray:
+    """32-bit hashes of the distinct ``k``-word shingles of ``text`` (lower-cased)."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < k:
+        grams = {" ".join(words)} if words else set()
+    else:
+        grams = {" ".join(words[i : i + k]) for i in range(len(words) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """MinHash signatures via ``(a * h + b) mod p`` permutations, vectorised over all shingles."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a, b < 2**32 and h < 2**32 keep a * h + b inside uint64 before the modulo.
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text)
+        if hashes.size == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(a == b))
+
+
+class LSHIndex:
+    """Banded locality-sensitive hash index over MinHash signatures.
+
+    With ``bands`` bands of ``rows`` rows, pairs whose Jaccard similarity is above
+    roughly ``(1 / bands) ** (1 / rows)`` are likely to share a bucket; candidates
+    are then checked against the exact signature ``threshold``.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.85):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = defaultdict(set)
+
+    def _keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        self.remove([key])
+        self.signatures[key] = signature
+        for bucket in self._keys(signature):
+            self._buckets[bucket].add(key)
+
+    def remove(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            signature = self.signatures.pop(key, None)
+            if signature is None:
+                continue
+            for bucket in self._keys(signature):
+                members = self._buckets.get(bucket)
+                if members is not None:
+                    members.discard(key)
+                    if not members:
+                        del self._buckets[bucket]
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Most similar indexed key at or above the threshold, or None."""
+        candidates: Set[str] = set()
+        for bucket in self._keys(signature):
+            candidates |= self._buckets.get(bucket, set())
+        best: Optional[Tuple[str, float]] = None
+        for key in sorted(candidates):
+            score = similarity(signature, self.signatures[key])
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.signatures
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        keys = sorted(self.signatures)
+        if not keys:
+            return keys, np.empty((0, self.rows * self.bands), dtype=np.uint64)
+        return keys, np.vstack([self.signatures[k] for k in keys])
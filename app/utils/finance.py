@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# (first_page, last_page, text) with 1-based, inclusive page numbers.
+PageGroup = Tuple[int, int, str]
+
+
+def page_marker(page_number: int) -> str:
+    return f"--- Page {page_number} ---"
+
+
+def group_pages(
+    pages: Sequence[str],
+    max_chars: int,
+    page_numbers: Optional[Sequence[int]] = None,
+) -> List[PageGroup]:
+    """Pack consecutive pages into groups of at most ``max_chars`` characters.
+
+    Every page is prefixed with a page marker so the model can cite where a value
+    came from. Pages longer than ``max_chars`` are split on their own.
+    ``page_numbers`` gives the original page numbers when ``pages`` is a selection.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, len(pages) + 1)
+    groups: List[PageGroup] = []
+    buf: List[str] = []
+    size = 0
+    first = last = 1
+    for number, text in zip(page_numbers, pages):
+        text = text or ""
+        pieces = [text[i : i + max_chars] for i in range(0, len(text), max_chars)] or [""]
+        for piece in pieces:
+            block = f"{page_marker(number)}\n{piece}\n"
+            if buf and size + len(block) > max_chars:
+                groups.append((first, last, "".join(buf)))
+                buf, size = [], 0
+            if not buf:
+                first = number
+            buf.append(block)
+            size += len(block)
+            last = number
+    if buf:
+        groups.append((first, last, "".join(buf)))
+    return groups
+
+
+def _as_page(value: Any, first: int, last: int) -> int:
+    try:
+        page = int(value)
+    except (TypeError, ValueError):
+        return first
+    return page if first <= page <= last else first
+
+
+def _normalise(value: Any) -> Any:
+    """Comparable form of a value so that 1.0e9, 1000000000 and "1000000000" agree."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 4)
+    if isinstance(value, str):
+        try:
+            return round(float(value.replace(",", "").replace("$", "").strip()), 4)
+        except ValueError:
+            return value.strip().lower()
+    return repr(value)
+
+
+def _flatten_paths(d: Dict, prefix: Tuple[str, ...] = ()) -> Iterable[Tuple[Tuple[str, ...], Any]]:
+    for k, v in d.items():
+        path = prefix + (str(k),)
+        if isinstance(v, dict):
+            yield from _flatten_paths(v, path)
+        elif v is not None:
+            yield path, v
+
+
+def _unflatten_paths(items: Dict[Tuple[str, ...], Any]) -> Dict:
+    out: Dict = {}
+    # Shorter paths first so that a value reported both as a leaf and as a
+    # parent of sub-segments ends up as that parent's "total".
+    for path in sorted(items, key=len):
+        node = out
+        for part in path[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = {} if child is None else {"total": child}
+                node[part] = child
+            node = child
+        if isinstance(node.get(path[-1]), dict):
+            node[path[-1]]["total"] = items[path]
+        else:
+            node[path[-1]] = items[path]
+    return out
+
+
+SERIES_METRICS = (
+    "total_revenue",
+    "revenue_growth",
+    "operating_profit",
+    "operating_margin",
+    "net_income",
+    "earnings_per_share",
+    "operating_cash_flow",
+)
+
+
+def _pick(candidates: List[Tuple[Any, int]], numeric: bool = False) -> Tuple[Any, List[int]]:
+    """Choose the value reported most often; ties go to the earliest page.
+
+    With ``numeric``, values are already parsed and unparsed ones (None or NaN),
+    such as "N/A" placeholders, do not vote; None is returned when none are left.
+    """
+    if numeric:
+        candidates = [(v, p) for v, p in candidates if v is not None and not np.isnan(v)]
+        if not candidates:
+            return None, []
+    votes: Dict[Any, List[Tuple[Any, int]]] = defaultdict(list)
+    for value, page in candidates:
+        votes[_normalise(value)].append((value, page))
+    best = min(votes.values(), key=lambda c: (-len(c), min(p for _, p in c)))
+    value = next((v for v, _ in best if isinstance(v, (int, float))), best[0][0])
+    return value, sorted({p for _, p in best})
+
+
+def merge_partial_extractions(
+    partials: Sequence[Tuple[int, int, Optional[Dict]]],
+    required_keys: Sequence[str],
+    nested_keys: Sequence[str] = ("revenue_breakdown",),
+    numeric_keys: Sequence[str] = SERIES_METRICS,
+) -> Dict:
+    """Reconcile per-chunk extractions into one result with the ``required_keys`` schema.
+
+    ``partials`` holds ``(first_page, last_page, data)`` for every chunk, where ``data``
+    may carry a ``source_pages`` mapping of key -> page. The merged result gets a
+    ``_sources`` mapping of key (``/``-joined path for nested keys) -> pages.
+    Values of ``numeric_keys`` and nested leaves come back as floats; values that
+    do not parse as numbers (placeholders such as "N/A") are ignored for them.
+    The outcome depends only on the inputs, never on the order chunks finished in.
+    """
+    scalars: Dict[str, List[Tuple[Any, int]]] = defaultdict(list)
+    nested: Dict[str, Dict[Tuple[str, ...], List[Tuple[Any, int]]]] = defaultdict(lambda: defaultdict(list))
+
+    for first, last, data in sorted(partials, key=lambda p: (p[0], p[1])):
+        if not isinstance(data, dict):
+            continue
+        cited = data.get("source_pages") if isinstance(data.get("source_pages"), dict) else {}
+        for key in required_keys:
+            value = data.get(key)
+            if value is None:
+                continue
+            page = _as_page(cited.get(key), first, last)
+            if key in nested_keys and isinstance(value, dict):
+                for path, leaf in _flatten_paths(value):
+                    nested[key][path].append((leaf, page))
+            elif key not in nested_keys:
+                scalars[key].append((value, page))
+
+    result: Dict[str, Any] = {k: None for k in required_keys}
+    sources: Dict[str, List[int]] = {}
+    for key, candidates in scalars.items():
+        if key in numeric_keys:
+            candidates = [(to_number(v), p) for v, p in candidates]
+        result[key], sources[key] = _pick(candidates, numeric=key in numeric_keys)
+        if result[key] is None:
+            del sources[key]
+    for key, paths in nested.items():
+        # Breakdown leaves are amounts; parse every candidate of every leaf in one pass.
+        amounts = iter(coerce_numbers([v for candidates in paths.values() for v, _ in candidates]).tolist())
+        chosen = {}
+        for path, candidates in paths.items():
+            value, pages = _pick([(next(amounts), p) for _, p in candidates], numeric=True)
+            if value is not None:
+                chosen[path], sources["/".join((key,) + path)] = value, pages
+        result[key] = _unflatten_paths(chosen) or None
+    result["_sources"] = sources
+    return result
+
+
+def to_number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").replace("$", "").replace("%", "").strip())
+    except ValueError:
+        return None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    number = to_number(str(value).upper().lstrip("QFY") if isinstance(value, str) else value)
+    return int(number) if number is not None else None
+
+
+def period_label(fiscal_year: int, fiscal_quarter: Optional[int]) -> str:
+    return f"Q{fiscal_quarter} {fiscal_year}" if fiscal_quarter else f"FY {fiscal_year}"
+
+
+BREAKDOWN_COLUMNS = ("path", "label", "parent", "level", "value", "share_of_parent", "is_leaf")
+PATH_SEP = " / "
+UNALLOCATED = "Unallocated"
+# Keys that hold a segment's own total rather than a sub-segment.
+_TOTAL_KEYS = {"total", "subtotal", "total_revenue", "revenue", "amount", "value"}
+# Keys that are rates, not amounts, and must never be summed. Whole words only,
+# so segments such as "Exchange services" or "Shareholder services" are kept.
+_NON_ADDITIVE_RE = re.compile(r"\b(growth|margin|yoy|pct|percent(age)?|ratio|change)\b|%", re.IGNORECASE)
+_SCALES = {"": 1.0, "k": 1e3, "thousand": 1e3, "m": 1e6, "mn": 1e6, "million": 1e6,
+           "b": 1e9, "bn": 1e9, "billion": 1e9, "t": 1e12, "trillion": 1e12}
+# Children within this fraction of their parent's total are treated as adding up.
+_RECONCILE_TOLERANCE = 0.005
+
+
+def _is_total_key(key: Any) -> bool:
+    return str(key).strip().casefold().replace(" ", "_") in _TOTAL_KEYS
+
+
+def _segment_total(node: Dict) -> Any:
+    return next((v for k, v in node.items() if _is_total_key(k) and not isinstance(v, dict)), None)
+
+
+def _breakdown_nodes(node: Dict, prefix: Tuple[str, ...] = ()) -> Iterable[Tuple[Tuple[str, ...], Any]]:
+    """``(path, reported value)`` for every segment; a nested segment reports its total entry, if any."""
+    for k, v in node.items():
+        if _NON_ADDITIVE_RE.search(re.sub(r"[_\-]", " ", str(k))) or (_is_total_key(k) and not isinstance(v, dict)):
+            continue
+        path = prefix + (str(k).strip(),)
+        if isinstance(v, dict):
+            yield path, _segment_total(v)
+            yield from _breakdown_nodes(v, path)
+        else:
+            yield path, v
+
+
+def coerce_numbers(values: Sequence[Any]) -> np.ndarray:
+    """Parse amounts such as ``1200``, ``"$1,200"``, ``"(35)"`` or ``"4.2 billion"`` in one pass; others become NaN.
+
+    Percentages and booleans are not amounts and also become NaN.
+    """
+    series = pd.Series(list(values), dtype=object)
+    numbers = pd.to_numeric(series.where(~series.map(lambda v: isinstance(v, bool))), errors="coerce")
+    text = series[numbers.isna() & series.map(lambda v: isinstance(v, str))].str.strip().str.lower()
+    if not text.empty:
+        negative = text.str.match(r"^\(.*\)$") | text.str.startswith("-")
+        parts = text.str.replace(r"[\s$€£,()+-]", "", regex=True).str.extract(r"^(\d*\.?\d+)([a-z]*)$")
+        parsed = pd.to_numeric(parts[0], errors="coerce") * parts[1].map(_SCALES).astype(float)
+        numbers.loc[text.index] = parsed.where(~negative, -parsed)
+    return numbers.to_numpy(dtype=float)
+
+
+def normalise_breakdown(breakdown: Dict) -> pd.DataFrame:
+    """Turn a nested revenue breakdown into one row per segment.
+
+    Columns are :data:`BREAKDOWN_COLUMNS`. Values are coerced to numbers;
+    segments without a numeric value are dropped. Parents are reconciled with
+    their children bottom-up: a missing parent total becomes the children's
+    sum, children exceeding the total replace it, and a shortfall is shown as
+    an ``Unallocated`` child. Only leaves add up to the root, so charts summing
+    leaves never double-count.
+    """
+    nodes = list(_breakdown_nodes(breakdown or {}))
+    if not nodes:
+        return pd.DataFrame(columns=list(BREAKDOWN_COLUMNS))
+    frame = pd.DataFrame({
+        "path": [PATH_SEP.join(p) for p, _ in nodes],
+        "label": [p[-1] for p, _ in nodes],
+        "parent": [PATH_SEP.join(p[:-1]) for p, _ in nodes],
+        "level": [len(p) for p, _ in nodes],
+        "value": coerce_numbers([v for _, v in nodes]),
+    }).drop_duplicates("path", keep="first")
+
+    # The root is a pseudo-row with an empty path holding the breakdown's own total.
+    root = pd.DataFrame({"path": [""], "label": [""], "parent": [None], "level": [0],
+                         "value": coerce_numbers([_segment_total(breakdown or {})])})
+    frame = pd.concat([root, frame], ignore_index=True)
+    others = []
+    for level in range(int(frame["level"].max()), 0, -1):
+        sums = frame.loc[frame["level"] == level].groupby("parent")["value"].sum(min_count=1)
+        is_parent = frame["path"].isin(sums.index)
+        reported = frame.loc[is_parent, "value"]
+        children = frame.loc[is_parent, "path"].map(sums)
+        gap = reported - children
+        short = gap > children.abs() * _RECONCILE_TOLERANCE
+        others.append(pd.DataFrame({
+            "path": frame.loc[is_parent, "path"][short].map(lambda p: f"{p}{PATH_SEP}{UNALLOCATED}" if p else UNALLOCATED),
+            "label": UNALLOCATED,
+            "parent": frame.loc[is_parent, "path"][short],
+            "level": level,
+            "value": gap[short],
+        }))
+        frame.loc[is_parent, "value"] = reported.where(reported.notna() & (gap >= -children.abs() * _RECONCILE_TOLERANCE), children)
+    frame = pd.concat([frame] + others, ignore_index=True)
+    frame = frame[frame["value"].notna()]
+
+    parent_value = frame["parent"].map(frame.set_index("path")["value"])
+    frame = frame.assign(
+        share_of_parent=(frame["value"] / parent_value.where(parent_value != 0)).astype(float),
+        is_leaf=~frame["path"].isin(frame["parent"]),
+    )
+    frame = frame[frame["level"] > 0].sort_values(["parent", "level"], kind="stable")
+    return frame.loc[:, list(BREAKDOWN_COLUMNS)].reset_index(drop=True)
+
+
+def metrics_record(data: Dict, report_name: str, source_hash: str) -> Optional[Dict]:
+    """Normalise a parsed report into one company/period row, or None if the period is unknown."""
+    company = (data.get("company_name") or "").strip()
+    year = _to_int(data.get("fiscal_year"))
+    quarter = _to_int(data.get("fiscal_quarter"))
+    if not company or year is None:
+        return None
+    if quarter is not None and not 1 <= quarter <= 4:
+        quarter = None
+    record = {
+        "company": company,
+        "company_key": company.casefold(),
+        "fiscal_year": year,
+        "fiscal_quarter": quarter,
+        "period": period_label(year, quarter),
+        # Full-year rows sort after the fourth quarter of the same year.
+        "period_sort": year * 10 + (quarter or 5),
+        "report_name": report_name,
+        "source_hash": source_hash,
+    }
+    for key in SERIES_METRICS:
+        record[key] = to_number(data.get(key))
+    breakdown = data.get("revenue_breakdown")
+    table = normalise_breakdown(breakdown) if isinstance(breakdown, dict) else None
+    record["segments"] = [] if table is None else [
+        {"segment": row.label, "value": float(row.value)} for row in table[table["level"] == 1].itertuples()
+    ]
+    return record
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, List
+
+OPS = {"add", "remove", "replace", "move", "copy", "test"}
+
+# Fields managed by the app itself that a patch may never touch; source_hash is
+# the unique ingest key, so editing it could collide with another document.
+PROTECTED_FIELDS = {"_id", "_version", "source_hash", "ingested_at", "last_ingested_at"}
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_pointer(path: str) -> List[str]:
+    """Split an RFC 6901 JSON Pointer into its unescaped tokens."""
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer: {path!r}")
+    return [t.replace("~1", "/").replace("~0", "~") for t in path[1:].split("/")]
+
+
+def validate_patch(patch: Any) -> List[Dict]:
+    """Check that ``patch`` is a well-formed RFC 6902 operation list and return it."""
+    if not isinstance(patch, list):
+        raise PatchError("Patch must be a JSON array of operations")
+    for i, op in enumerate(patch):
+        if not isinstance(op, dict) or op.get("op") not in OPS:
+            raise PatchError(f"Operation {i} has an unknown or missing 'op'")
+        for key in ("path",) + (("from",) if op["op"] in ("move", "copy") else ()):
+            if not isinstance(op.get(key), str):
+                raise PatchError(f"Operation {i} is missing '{key}'")
+            tokens = parse_pointer(op[key])
+            if not tokens:
+                raise PatchError(f"Operation {i} may not target the whole document")
+            if tokens[0] in PROTECTED_FIELDS:
+                raise PatchError(f"Operation {i} may not modify '{tokens[0]}'")
+        if op["op"] in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"Operation {i} is missing 'value'")
+    return patch
+
+
+def _parent(doc: Any, tokens: List[str]):
+    node = doc
+    for t in tokens[:-1]:
+        if isinstance(node, list):
+            node = node[_index(node, t)]
+        elif isinstance(node, dict) and t in node:
+            node = node[t]
+        else:
+            raise PatchError(f"Path segment {t!r} does not exist")
+    return node, tokens[-1]
+
+
+def _index(node: list, token: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(node)
+    if not token.isdigit():
+        raise PatchError(f"Invalid array index {token!r}")
+    i = int(token)
+    if i > len(node) or (i == len(node) and not allow_end):
+        raise PatchError(f"Array index {i} out of range")
+    return i
+
+
+def _get(doc: Any, tokens: List[str]) -> Any:
+    parent, last = _parent(doc, tokens)
+    if isinstance(parent, list):
+        return parent[_index(parent, last)]
+    if isinstance(parent, dict) and last in parent:
+        return parent[last]
+    raise PatchError(f"Path {'/'.join(tokens)!r} does not exist")
+
+
+def _add(doc: Any, tokens: List[str], value: Any) -> None:
+    parent, last = _parent(doc, tokens)
+    if isinstance(parent, list):
+        parent.insert(_index(parent, last, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[last] = value
+    else:
+        raise PatchError(f"Cannot add below a scalar at {'/'.join(tokens)!r}")
+
+
+def _remove(doc: Any, tokens: List[str]) -> Any:
+    parent, last = _parent(doc, tokens)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, last))
+    if isinstance(parent, dict) and last in parent:
+        return parent.pop(last)
+    raise PatchError(f"Path {'/'.join(tokens)!r} does not exist")
+
+
+def apply_patch(doc: Dict, patch: List[Dict]) -> Dict:
+    """Apply a validated patch to a copy of ``doc``; the input is left untouched."""
+    result = copy.deepcopy(doc)
+    for op in validate_patch(patch):
+        tokens = parse_pointer(op["path"])
+        kind = op["op"]
+        if kind == "add":
+            _add(result, tokens, copy.deepcopy(op["value"]))
+        elif kind == "remove":
+            _remove(result, tokens)
+        elif kind == "replace":
+            _remove(result, tokens)
+            _add(result, tokens, copy.deepcopy(op["value"]))
+        elif kind == "move":
+            value = _remove(result, parse_pointer(op["from"]))
+            _add(result, tokens, value)
+        elif kind == "copy":
+            _add(result, tokens, copy.deepcopy(_get(result, parse_pointer(op["from"]))))
+        elif kind == "test" and _get(result, tokens) != op["value"]:
+            raise PatchError(f"Test failed at {op['path']!r}")
+    return result
+
+
+def _dottable(key: Any) -> bool:
+    return isinstance(key, str) and key != "" and "." not in key and not key.startswith("$")
+
+
+def diff_to_update(old: Dict, new: Dict) -> Dict:
+    """Smallest ``$set``/``$unset`` update that turns ``old`` into ``new``.
+
+    Nested objects are diffed field by field using dotted paths; arrays, and
+    objects whose keys cannot be written as dotted paths, are replaced whole.
+    """
+    sets: Dict[str, Any] = {}
+    unsets: Dict[str, str] = {}
+
+    def walk(a: Dict, b: Dict, prefix: str) -> None:
+        for key in sorted(a.keys() - b.keys()):
+            unsets[prefix + key] = ""
+        for key, value in b.items():
+            if key in a and a[key] == value:
+                continue
+            if key in a and isinstance(a[key], dict) and isinstance(value, dict) and all(map(_dottable, value)) and all(map(_dottable, a[key])):
+                walk(a[key], value, f"{prefix}{key}.")
+            else:
+                sets[prefix + key] = value
+
+    old = {k: v for k, v in old.items() if k not in PROTECTED_FIELDS}
+    new = {k: v for k, v in new.items() if k not in PROTECTED_FIELDS}
+    if not all(map(_dottable, old)) or not all(map(_dottable, new)):
+        raise PatchError("Top-level field names must not contain '.' or start with '$'")
+    walk(old, new, "")
+    update: Dict[str, Dict] = {}
+    if sets:
+        update["$set"] = sets
+    if unsets:
+        update["$unset"] = unsets
+    return update
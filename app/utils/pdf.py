@@ -1,18 +1,60 @@
 from __future__ import annotations
 
-from typing import List
+import hashlib
+import re
+from typing import List, Tuple
 
-import PyPDF2
+from app.config.settings import settings
+from app.utils.pdf_backends import backend_chain, extract_pages
 
 
-def extract_text_from_pdf(file) -> str:
-    pdf_reader = PyPDF2.PdfReader(file)
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text()
-    return text
+def read_file_bytes(file) -> bytes:
+    """Return the full content of an uploaded file without moving its read position."""
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    pos = file.tell()
+    file.seek(0)
+    data = file.read()
+    file.seek(pos)
+    return data
 
 
-def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
-    words = text.split()
-    return [" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size)]
+def content_hash(file) -> str:
+    return hashlib.sha256(read_file_bytes(file)).hexdigest()
+
+
+def extract_pages_from_pdf(file) -> List[str]:
+    """Text of every page, using the configured backend with per-page fallback."""
+    chain = backend_chain(settings.pdf_backend, settings.pdf_fallback_backends.split(","))
+    return extract_pages(read_file_bytes(file), chain)
+
+
+def chunk_pages(pages: List[str], chunk_size: int = 500) -> List[Tuple[str, int, int]]:
+    """Split the concatenated pages into ``chunk_size``-word chunks, keeping each chunk's 1-based page span."""
+    words: List[str] = []
+    page_of: List[int] = []
+    for number, text in enumerate(pages, start=1):
+        page_words = text.split()
+        words.extend(page_words)
+        page_of.extend([number] * len(page_words))
+    return [
+        (" ".join(words[i : i + chunk_size]), page_of[i], page_of[min(i + chunk_size, len(words)) - 1])
+        for i in range(0, len(words), chunk_size)
+    ]
+
+
+_DOC_TYPES = [
+    ("10-K", re.compile(r"\b10[-\s]?K\b|annual report", re.I)),
+    ("10-Q", re.compile(r"\b10[-\s]?Q\b|quarterly report", re.I)),
+    ("8-K", re.compile(r"\b8[-\s]?K\b", re.I)),
+    ("earnings release", re.compile(r"earnings|results (?:for|of) the", re.I)),
+]
+
+
+def guess_document_type(file_name: str, first_page: str = "") -> str:
+    """Best-effort filing type from the file name, then the first page."""
+    for source in (file_name, first_page[:2000]):
+        for label, pattern in _DOC_TYPES:
+            if pattern.search(source):
+                return label
+    return "other"
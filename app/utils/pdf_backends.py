@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import importlib.util
+import io
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+
+class PdfBackend(ABC):
+    """A PDF text-extraction engine.
+
+    Backends open a document once and then return the text of single pages, so
+    a page that fails in one engine can be retried in another.
+    """
+
+    name = ""
+    module = ""
+
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec(cls.module) is not None
+
+    @abstractmethod
+    def open(self, data: bytes) -> Any:
+        ...
+
+    @abstractmethod
+    def page_count(self, doc: Any) -> int:
+        ...
+
+    @abstractmethod
+    def page_text(self, doc: Any, index: int) -> Optional[str]:
+        ...
+
+    def close(self, doc: Any) -> None:
+        pass
+
+
+class PyPDF2Backend(PdfBackend):
+    name = "pypdf2"
+    module = "PyPDF2"
+
+    def open(self, data: bytes) -> Any:
+        import PyPDF2
+
+        return PyPDF2.PdfReader(io.BytesIO(data))
+
+    def page_count(self, doc: Any) -> int:
+        return len(doc.pages)
+
+    def page_text(self, doc: Any, index: int) -> Optional[str]:
+        return doc.pages[index].extract_text()
+
+
+class PypdfBackend(PyPDF2Backend):
+    name = "pypdf"
+    module = "pypdf"
+
+    def open(self, data: bytes) -> Any:
+        import pypdf
+
+        return pypdf.PdfReader(io.BytesIO(data))
+
+
+class PyMuPDFBackend(PdfBackend):
+    name = "pymupdf"
+    module = "pymupdf"
+
+    def open(self, data: bytes) -> Any:
+        import pymupdf
+
+        return pymupdf.open(stream=data, filetype="pdf")
+
+    def page_count(self, doc: Any) -> int:
+        return doc.page_count
+
+    def page_text(self, doc: Any, index: int) -> Optional[str]:
+        return doc.load_page(index).get_text()
+
+    def close(self, doc: Any) -> None:
+        doc.close()
+
+
+class PdfiumBackend(PdfBackend):
+    name = "pdfium"
+    module = "pypdfium2"
+
+    def open(self, data: bytes) -> Any:
+        import pypdfium2
+
+        return pypdfium2.PdfDocument(data)
+
+    def page_count(self, doc: Any) -> int:
+        return len(doc)
+
+    def page_text(self, doc: Any, index: int) -> Optional[str]:
+        page = doc[index]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+            page.close()
+
+    def close(self, doc: Any) -> None:
+        doc.close()
+
+
+BACKENDS: Dict[str, Type[PdfBackend]] = {
+    b.name: b for b in (PyPDF2Backend, PypdfBackend, PyMuPDFBackend, PdfiumBackend)
+}
+
+
+def available_backends() -> List[str]:
+    return [name for name, cls in BACKENDS.items() if cls.available()]
+
+
+def backend_chain(primary: str, fallbacks: List[str]) -> List[PdfBackend]:
+    """Instantiate ``primary`` followed by ``fallbacks``, skipping unknown or uninstalled engines."""
+    chain: List[PdfBackend] = []
+    for name in [primary] + fallbacks:
+        name = name.strip().lower()
+        cls = BACKENDS.get(name)
+        if cls is None:
+            logger.warning("Unknown PDF backend %r", name)
+            continue
+        if not cls.available():
+            logger.warning("PDF backend %r is not installed", name)
+            continue
+        if all(b.name != name for b in chain):
+            chain.append(cls())
+    if not chain:
+        chain.append(PyPDF2Backend())
+    return chain
+
+
+def extract_pages(data: bytes, chain: List[PdfBackend]) -> List[str]:
+    """Extract every page with the first backend, retrying failed pages on the next ones.
+
+    A page counts as failed when the engine raises or returns None; if every
+    engine fails on a page its text is empty.
+    """
+    opened: Dict[int, Any] = {}
+
+    def doc_for(position: int) -> Any:
+        if position not in opened:
+            # Remember a failed open so the engine is not retried on every page.
+            opened[position] = None
+            opened[position] = chain[position].open(data)
+        if opened[position] is None:
+            raise RuntimeError(f"PDF backend {chain[position].name} could not open the document")
+        return opened[position]
+
+    try:
+        count = None
+        for position, backend in enumerate(chain):
+            try:
+                count = backend.page_count(doc_for(position))
+                break
+            except Exception:
+                logger.exception("PDF backend %s could not open the document", backend.name)
+        if count is None:
+            raise ValueError("No PDF backend could open the document")
+
+        pages: List[str] = []
+        for index in range(count):
+            text = None
+            for position, backend in enumerate(chain):
+                try:
+                    text = backend.page_text(doc_for(position), index)
+                except Exception:
+                    logger.warning("PDF backend %s failed on page %s", backend.name, index + 1, exc_info=True)
+                    text = None
+                if text is not None:
+                    break
+            pages.append(text or "")
+        return pages
+    finally:
+        for position, doc in opened.items():
+            if doc is None:
+                continue
+            try:
+                chain[position].close(doc)
+            except Exception:
+                logger.debug("Closing PDF backend %s failed", chain[position].name, exc_info=True)
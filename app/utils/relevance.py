@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import re
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+# Phrases that mark financial statements and segment tables, with their weight.
+FINANCIAL_TERMS = {
+    "consolidated statements of income": 6.0,
+    "consolidated statements of operations": 6.0,
+    "condensed consolidated statements": 4.0,
+    "statements of cash flows": 6.0,
+    "cash flows from operating activities": 5.0,
+    "net cash provided by operating activities": 5.0,
+    "segment information": 5.0,
+    "revenue by segment": 5.0,
+    "income from operations": 3.0,
+    "operating income": 3.0,
+    "operating margin": 3.0,
+    "total revenue": 3.0,
+    "revenues": 1.5,
+    "revenue": 1.0,
+    "net income": 3.0,
+    "earnings per share": 3.0,
+    "diluted": 1.5,
+    "three months ended": 2.0,
+    "year ended": 1.5,
+    "year-over-year": 1.5,
+    "balance sheets": 2.0,
+}
+
+# Phrases typical of boilerplate pages that never hold the numbers we need.
+BOILERPLATE_TERMS = {
+    "forward-looking statements": 4.0,
+    "safe harbor": 4.0,
+    "risk factors": 3.0,
+    "table of contents": 2.0,
+    "signatures": 2.0,
+    "exhibit index": 3.0,
+    "pursuant to the requirements": 2.0,
+}
+
+FINANCIAL_QUERY = (
+    "Consolidated statements of income with total revenue, operating income, net income and "
+    "diluted earnings per share; revenue by segment; statements of cash flows."
+)
+
+_NUMBER_RE = re.compile(r"\(?\$?\d[\d,]*(?:\.\d+)?\)?%?")
+_TOKEN_RE = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English prose and tables)."""
+    return len(text) // 4 + 1
+
+
+def score_page(text: str) -> float:
+    """Cheap local relevance score combining financial keywords and number density."""
+    if not text:
+        return 0.0
+    lower = text.lower()
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return 0.0
+    keyword = sum(w * min(lower.count(t), 5) for t, w in FINANCIAL_TERMS.items())
+    penalty = sum(w * min(lower.count(t), 3) for t, w in BOILERPLATE_TERMS.items())
+    numbers = len(_NUMBER_RE.findall(text))
+    density = numbers / len(tokens)
+    money = lower.count("$") + lower.count("%")
+    return max(0.0, keyword - penalty + 20.0 * density + 0.2 * min(money, 50))
+
+
+def score_pages(
+    pages: Sequence[str],
+    embed: Optional[Callable[[List[str]], List[np.ndarray]]] = None,
+    query: str = FINANCIAL_QUERY,
+    embedding_weight: float = 10.0,
+) -> List[float]:
+    """Score every page; with ``embed`` the cosine similarity to ``query`` is added in."""
+    scores = [score_page(p) for p in pages]
+    if embed is None:
+        return scores
+    candidates = [i for i, s in enumerate(scores) if s > 0]
+    if not candidates:
+        return scores
+    vectors = embed([query] + [pages[i][:8000] for i in candidates])
+    matrix = np.vstack(vectors).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    similarity = matrix[1:] @ matrix[0]
+    for i, sim in zip(candidates, similarity):
+        scores[i] += embedding_weight * float(sim)
+    return scores
+
+
+def select_pages(
+    pages: Sequence[str],
+    token_budget: int,
+    embed: Optional[Callable[[List[str]], List[np.ndarray]]] = None,
+) -> List[int]:
+    """Return indices (in document order) of the best-scoring pages that fit ``token_budget``.
+
+    A budget of 0 or less keeps every page.
+    """
+    if token_budget <= 0:
+        return list(range(len(pages)))
+    scores = score_pages(pages, embed=embed)
+    ranked = sorted(range(len(pages)), key=lambda i: (-scores[i], i))
+    chosen: List[int] = []
+    used = 0
+    for i in ranked:
+        if scores[i] <= 0 and chosen:
+            break
+        cost = estimate_tokens(pages[i])
+        if used + cost > token_budget:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen and ranked:
+        chosen.append(ranked[0])
+    return sorted(chosen)
+
+
+def select_text(
+    pages: Sequence[str],
+    token_budget: int,
+    embed: Optional[Callable[[List[str]], List[np.ndarray]]] = None,
+) -> str:
+    """Join the selected pages, trimming the result to the budget if a single page overflows it."""
+    text = "\n".join(pages[i] for i in select_pages(pages, token_budget, embed=embed))
+    if token_budget > 0:
+        text = text[: token_budget * 4]
+    return text
@@ -0,0 +1,162 @@
+"""Compare PDF text-extraction backends on a fixed local corpus.
+
+Run from the project root:
+
+    python -m benchmarks.pdf_extraction [--corpus benchmarks/pdf_corpus] [--backends pypdf2,pymupdf] [--repeat 3]
+
+Every ``*.pdf`` in the corpus is extracted with each installed backend and the
+report lists pages/s and text fidelity. Fidelity is the word-level F1 score
+against ``<name>.txt`` next to the PDF when present, otherwise against the
+first backend's output. If the corpus directory has no PDFs, a deterministic
+synthetic corpus of financial-report-like pages (with ground-truth text) is
+generated into it first, so results are comparable between machines.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.utils.pdf_backends import BACKENDS, available_backends, extract_pages
+
+DEFAULT_CORPUS = Path(__file__).parent / "pdf_corpus"
+
+_SEGMENTS = ["Advertising", "Subscriptions", "Cloud", "Devices", "Licensing", "Services", "Other revenue"]
+_LINES = [
+    "Consolidated Statements of Income (in millions, except per share amounts)",
+    "Three Months Ended June 30, 2024 compared with the prior year period",
+    "Net cash provided by operating activities",
+    "Diluted earnings per share",
+    "Income from operations",
+    "Forward-looking statements involve risks and uncertainties",
+]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_simple_pdf(path: Path, pages: List[List[str]]) -> None:
+    """Write a minimal valid PDF with one Helvetica text line per entry."""
+    objects: List[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_id, lines in zip(page_ids, pages):
+        body = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_escape(l)}) Tj T*" for l in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def generate_corpus(directory: Path, documents: int = 8, pages: int = 12, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for d in range(documents):
+        doc_pages = []
+        for _ in range(pages):
+            lines = []
+            for _ in range(50):
+                if rng.random() < 0.5:
+                    lines.append(f"{rng.choice(_SEGMENTS)}  ${rng.randint(100, 99999):,}  ${rng.randint(100, 99999):,}  {rng.uniform(-20, 40):.1f}%")
+                else:
+                    lines.append(rng.choice(_LINES))
+            doc_pages.append(lines)
+        name = directory / f"synthetic_report_{d + 1:02d}"
+        write_simple_pdf(name.with_suffix(".pdf"), doc_pages)
+        name.with_suffix(".txt").write_text("\n".join("\n".join(p) for p in doc_pages))
+
+
+def word_f1(candidate: str, reference: str) -> float:
+    cand, ref = Counter(candidate.split()), Counter(reference.split())
+    if not cand and not ref:
+        return 1.0
+    overlap = sum((cand & ref).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(cand.values())
+    recall = overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run(corpus: Path, backends: List[str], repeat: int) -> List[Dict]:
+    files = sorted(corpus.glob("*.pdf"))
+    blobs = {f: f.read_bytes() for f in files}
+    references: Dict[Path, Optional[str]] = {
+        f: f.with_suffix(".txt").read_text() if f.with_suffix(".txt").exists() else None for f in files
+    }
+    outputs: Dict[str, Dict[Path, str]] = {}
+    rows = []
+    for name in backends:
+        backend = BACKENDS[name]()
+        pages = failures = 0
+        elapsed = 0.0
+        texts: Dict[Path, str] = {}
+        for f in files:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                try:
+                    result = extract_pages(blobs[f], [backend])
+                except Exception:
+                    failures += 1
+                    result = []
+                elapsed += time.perf_counter() - start
+            pages += len(result)
+            texts[f] = "\n".join(result)
+        outputs[name] = texts
+        baseline = outputs[backends[0]]
+        scores = [word_f1(texts[f], references[f] if references[f] is not None else baseline[f]) for f in files]
+        rows.append({
+            "backend": name,
+            "pages": pages,
+            "seconds": elapsed / repeat,
+            "pages_per_s": pages * repeat / elapsed if elapsed else float("inf"),
+            "fidelity": sum(scores) / len(scores) if scores else 0.0,
+            "failures": failures,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--backends", default=",".join(available_backends()))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if not any(args.corpus.glob("*.pdf")):
+        generate_corpus(args.corpus)
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    missing = [n for n in names if n not in BACKENDS or not BACKENDS[n].available()]
+    if missing:
+        parser.error(f"Backends not available: {', '.join(missing)} (installed: {', '.join(available_backends())})")
+
+    rows = run(args.corpus, names, max(1, args.repeat))
+    print(f"{'backend':<10} {'pages':>6} {'seconds':>9} {'pages/s':>9} {'fidelity':>9} {'failures':>9}")
+    for r in sorted(rows, key=lambda r: -r["pages_per_s"]):
+        print(
+            f"{r['backend']:<10} {r['pages']:>6} {r['seconds']:>9.3f} {r['pages_per_s']:>9.1f} "
+            f"{r['fidelity']:>9.3f} {r['failures']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,12 +9,18 @@ from app.pages.pdf_to_mongo import pdf_to_mongodb_page
 from app.pages.mongo_audit import edit_mongodb_document
 from app.pages.mongo_viewer import db_image_page
 from app.pages.finance_hub import business_metrics_dashboard
+from app.services import chroma_store, mongodb, resources
 
 
 def main():
     # --- PAGE CONFIGURATION ---
     st.set_page_config(page_title="EnterRAG", page_icon="💼", layout="centered")
 
+    # One-time, per-process client warm-up and index bootstrap
+    resources.warm_up()
+    mongodb.bootstrap()
+    chroma_store.bootstrap()
+
     # --- MAIN PAGE CONFIGURATION ---
     st.title("EnterRAG 💼")
     st.write("*Talk to your Enterprise Documents 📄, Receive Insights: AI. Unlocked.*")